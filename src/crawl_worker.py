@@ -0,0 +1,26 @@
+import argparse
+import os
+import sys
+
+import urllib3
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'modules'))
+
+from modules.persistency.shared_frontier import FRONTIER_PATH
+from modules.process_manager import run_worker
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de uma coleta distribuída.")
+    parser.add_argument("db_path", nargs="?", default=FRONTIER_PATH, help="arquivo SQLite da fronteira compartilhada")
+    parser.add_argument("--batch-size", type=int, default=10, help="URLs reservadas por lote")
+    parser.add_argument("--lease-seconds", type=int, default=60, help="validade de cada reserva")
+    parser.add_argument("--worker-id", default=None, help="identificador do worker (padrão: host-pid)")
+    args = parser.parse_args()
+    run_worker(args.db_path, args.worker_id, args.batch_size, lease_seconds=args.lease_seconds)
+
+
+if __name__ == "__main__":
+    main()
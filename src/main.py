@@ -2,48 +2,301 @@ import json
 import sys
 import os
 import subprocess
+import threading
 import time
 import urllib3
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'modules'))
 
 from logger import get_logger
-from modules.data_processing import extract_text_and_links
-from modules.process_manager import start_scraping
+from modules.data_processing import (
+    DuplicateDetector,
+    create_connection_stats,
+    deduplicate_pages,
+    extract_text_and_links,
+    init_session,
+    read_connection_stats,
+)
+from modules.process_manager import (
+    HostScheduler,
+    KeywordScorer,
+    RobotsCache,
+    Stage,
+    WeightedScorer,
+    breadth_first,
+    embed_batch,
+    inlink_count,
+    iter_scraping,
+    iter_scraping_async,
+    iter_scraping_distributed,
+    run_pipeline,
+)
 from modules.persistency import (
+    CrawlState,
+    PageWriter,
+    EmbeddingCache,
+    QueryCache,
     OllamaEmbeddingFunction,
     count_words,
+    get_page,
+    search_pages,
+    create_database_file,
+    setup_database,
     initialize_chromadb,
     create_collection,
-    populate_collection,
-    save_many_pages,
+    split_into_chunks,
+    sync_chunks,
+    missing_sources,
+    delete_sources,
     process_query,
 )
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def scrape_and_save(base_url, max_depth, processes, vector_db_enabled=True):
+PAGES_PER_COMMIT = 500
+
+# Cosine similarity above which a cached answer serves a new question
+SEMANTIC_CACHE_SIMILARITY = 0.97
+
+# Statuses of pages whose stored text is still current
+UNCHANGED_STATUSES = ("unchanged", "not_modified")
+
+def store_pages(detector, writer, state, embedded, batch):
+    """
+    Store a batch of records and return the pages to chunk.
+
+    With a crawl state, records are marked done in the same transaction
+    that stores their pages; when `embedded`, the stored pages and the
+    unchanged ones, which may have never been embedded, are instead left
+    for embed_chunks to mark.
+    """
+    with writer.group():
+        writer.write_errors([page for page in batch if page['status'] == "error"])
+        fetched = [page for page in batch if page['status'] == "ok"]
+        pages, aliases = deduplicate_pages([(page['url'], page['text']) for page in fetched], detector)
+        writer.write(pages)
+        writer.write_aliases(aliases)
+        stored = {url for url, _ in pages}
+        # An alias's text is not stored: logged without a content hash or
+        # validators, it is fetched in full and deduplicated again next crawl
+        for page in fetched:
+            if page['url'] not in stored:
+                page.update(content_hash=None, etag=None, last_modified=None)
+        to_chunk = [page for page in fetched if page['url'] in stored]
+        if embedded:
+            to_chunk += [page for page in batch if page['status'] in UNCHANGED_STATUSES]
+        if state is not None:
+            pending = {id(page) for page in to_chunk} if embedded else set()
+            state.log([page for page in batch if id(page) not in pending])
+    return to_chunk
+
+def chunk_pages(collection, batch):
+    """
+    Split pages into the chunks the collection does not have yet, returning
+    one (record, chunks) item per page. Unchanged pages are only split when
+    the collection has no chunk of them, e.g. after a crawl without
+    embeddings or with the index deleted, their text read back from SQLite.
+    """
+    unembedded = missing_sources(
+        collection, [page['url'] for page in batch if page['status'] in UNCHANGED_STATUSES]
+    )
+    crawled_data = []
+    for page in batch:
+        if page['status'] not in UNCHANGED_STATUSES:
+            crawled_data.append({"url": page['url'], "content": page['text']})
+        elif page['url'] in unembedded:
+            stored = get_page(page['url'])
+            text = page['text'] or (stored['content'] if stored else "")
+            crawled_data.append({"url": page['url'], "content": text})
+    chunks, metadatas, ids = sync_chunks(collection, *split_into_chunks(crawled_data))
+    by_url = {page['url']: (page, []) for page in batch}
+    for chunk, meta, id_ in zip(chunks, metadatas, ids):
+        by_url[meta["source"]][1].append((chunk, meta, id_))
+    return list(by_url.values())
+
+class EmbeddingThroughput:
+    """
+    Chunks embedded by the pipeline and the wall-clock time from the first
+    batch to the last, shared by the embedding workers.
+    """
+
+    def __init__(self):
+        self.chunks = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, chunks, started):
+        with self._lock:
+            self.chunks += chunks
+            self.started = started if self.started is None else min(self.started, started)
+            self.finished = time.time()
+
+    def __str__(self):
+        elapsed = self.finished - self.started if self.chunks else 0
+        rate = self.chunks / elapsed if elapsed > 0 else 0
+        return f"{self.chunks} chunks in {elapsed:.2f}s ({rate:.1f} chunks/s)"
+
+def embed_chunks(collection, embedding_function, state, throughput, batch):
+    chunks = [chunk for _, page_chunks in batch for chunk in page_chunks]
+    if chunks:
+        started = time.time()
+        documents, metadatas, ids = (list(column) for column in zip(*chunks))
+        collection.upsert(
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids,
+            embeddings=embed_batch(embedding_function, documents),
+        )
+        throughput.add(len(chunks), started)
+    if state is not None:
+        state.log([page for page, _ in batch])
+
+def count_removed(records, totals):
+    for page in records:
+        totals['bytes_removed'] += page.get('bytes_removed', 0)
+        yield page
+
+def start_local_workers(count):
+    """
+    Launch `count` crawl_worker.py processes. They share the SQLite frontier
+    file, so more can only be started on this machine.
+    """
+    script = os.path.join(os.path.dirname(__file__), 'crawl_worker.py')
+    return [subprocess.Popen([sys.executable, script]) for _ in range(count)]
+
+def frontier_scorer(keywords=None):
+    """
+    Breadth-first order, or with keywords, pages likely to mention them first
+    with popular pages (many inlinks) breaking the ties.
+    """
+    if not keywords:
+        return breadth_first
+    return WeightedScorer((KeywordScorer(keywords), 10), (breadth_first, 1), (inlink_count, 0.1))
+
+def scrape_and_save(
+    base_url, max_depth, processes, vector_db_enabled=True, mode="process", content_mode="full",
+    max_pages=None, keywords=None, use_sitemaps=False, requests_per_second=None, max_per_host=None,
+    max_in_flight=4, allowed_domains=None,
+):
+    """
+    Crawl and stream every page through SQLite and, when enabled, the vector database.
+
+    Pages are stored, chunked and embedded while the crawl is still running,
+    so memory stays flat regardless of the crawl size. The process engine
+    keeps its crawl state in SQLite, so an interrupted crawl resumes and a
+    recrawl skips pages that did not change. With content_mode="main" only
+    the main content of each page is kept. `base_url` may be a list of seed
+    URLs, whose links are followed inside them or, with `allowed_domains`
+    (hostnames, subdomains included), anywhere on those domains instead.
+    With `max_pages` the process engine fetches at most that many pages,
+    the ones matching `keywords` first, and with `use_sitemaps` it queues
+    every page listed in the sites' sitemaps up front. Its requests
+    to each host are limited to `requests_per_second` and `max_per_host` in
+    flight when given; a robots.txt Crawl-delay or a Retry-After still slow
+    a host down without them. The distributed engine starts `processes`
+    local crawl_worker.py processes sharing a SQLite frontier. Returns the
+    collection, or None when the vector database is disabled.
+
+    Embedding batches are sent by `max_in_flight` workers, each keeping one
+    request to Ollama in flight and retrying failures with backoff, as
+    compute_embeddings_parallel does.
+    """
     logger = get_logger(__name__)
-    logger.info("Starting the web scraping process...")
-    pages_raw = start_scraping(base_url, max_depth, extract_text_and_links, processes)
-    logger.info(f"Scraping finished. {len(pages_raw)} pages scraped.")
-    pages = [(page['url'], page['text']) for page in pages_raw]
-    logger.info(f"Saving {len(pages)} pages to the Sqlite database...")
-    save_many_pages(pages)
+    logger.info(f"Starting the web scraping process ({mode} engine)...")
+    create_database_file()
+    setup_database()
+    # Every write of the crawl reaches SQLite through this writer, in
+    # transactions of PAGES_PER_COMMIT while the crawl runs
+    writer = PageWriter(commit_every=PAGES_PER_COMMIT)
+    connection_stats = None
+    state = None
+    workers = []
+    if mode == "async":
+        records = iter_scraping_async(
+            base_url, max_depth, concurrency=processes, content_mode=content_mode, allowed_domains=allowed_domains,
+        )
+    elif mode == "distributed":
+        records = iter_scraping_distributed(
+            base_url, max_depth, allowed_domains=allowed_domains, content_mode=content_mode,
+        )
+        workers = start_local_workers(processes)
+    else:
+        connection_stats = create_connection_stats()
+        state = CrawlState(writer)
+        records = iter_scraping(
+            base_url, max_depth, partial(extract_text_and_links, content_mode=content_mode), processes,
+            initializer=init_session, initargs=(connection_stats,), state=state,
+            scheduler=HostScheduler(
+                requests_per_second, max_per_host, RobotsCache(), frontier_scorer(keywords),
+            ),
+            allowed_domains=allowed_domains, max_pages=max_pages, use_sitemaps=use_sitemaps,
+        )
+
+    collection = None
+    if vector_db_enabled:
+        collection = setup_vector_db()
+        cache = EmbeddingCache()
+        embedding_function = OllamaEmbeddingFunction(cache=cache)
+        throughput = EmbeddingThroughput()
+    # A crawled page is only marked done in the crawl state once it is fully processed
+    stages = [
+        Stage(
+            "sqlite", partial(store_pages, DuplicateDetector(), writer, state, vector_db_enabled),
+            batch_size=100,
+        ),
+    ]
+    if vector_db_enabled:
+        stages += [
+            Stage("chunker", partial(chunk_pages, collection), batch_size=10),
+            Stage(
+                "embeddings", partial(embed_chunks, collection, embedding_function, state, throughput),
+                batch_size=10, workers=max_in_flight,
+            ),
+        ]
+
+    totals = {'bytes_removed': 0}
+    try:
+        counts = run_pipeline(count_removed(records, totals), stages)
+        writer.flush()
+        if state is not None and state.finished:
+            removed = state.stale_urls()
+            writer.delete(removed)
+            if collection is not None:
+                delete_sources(collection, removed)
+            state.end_run(removed)
+            logger.info(f"{len(removed)} pages no longer found were removed.")
+    except BaseException:
+        # Workers would otherwise crawl on until the whole frontier is done
+        for worker in workers:
+            worker.terminate()
+        raise
+    finally:
+        writer.close()
+        if state is not None:
+            state.close()
+        for worker in workers:
+            worker.wait()
+    logger.info(f"Scraping finished. {counts['sqlite']} pages scraped.")
+    if content_mode == "main":
+        logger.info(f"Boilerplate removed: {totals['bytes_removed'] / 1024:.1f} KiB of text")
+    if collection is not None:
+        logger.info(f"Embeddings: {throughput}")
+        logger.info(f"Embedding cache: {cache.stats()}")
+    if connection_stats is not None:
+        logger.info(f"HTTP connections: {read_connection_stats(connection_stats)}")
     logger.info("Data saved successfully.")
-    return pages
+    return collection
 
-def setup_vector_db(pages):
+def setup_vector_db():
     logger = get_logger(__name__)
     logger.info("Starting vector database population...")
     chroma_client = initialize_chromadb()
     embedding_function = OllamaEmbeddingFunction()
-    collection = create_collection(chroma_client, "text", embedding_function)
-    crawled_data = [{"url": url, "content": content} for url, content in pages]
-    populate_collection(collection, crawled_data)
-    logger.info("Process completed successfully!")
-    return collection
+    return create_collection(chroma_client, "text", embedding_function)
 
 def clear_databases():
     logger = get_logger(__name__)
@@ -67,14 +320,21 @@ def search_word(word):
         logger.error(f"Error searching for word: {e}")
         print(f"✗ Erro ao procurar palavra: {e}")
 
-def ai_query(collection, query):
+def query_cache():
+    """
+    Cache of retrievals and answers, semantic included, for the AI queries.
+    """
+    embedding_function = OllamaEmbeddingFunction(cache=EmbeddingCache())
+    return QueryCache(embedding_function=embedding_function, similarity=SEMANTIC_CACHE_SIMILARITY)
+
+def ai_query(collection, query, cache=None):
     logger = get_logger(__name__)
     try:
         if collection is None:
             print("✗ IA não está habilitada. Execute o scraping com IA primeiro.")
             return
         logger.info(f"Processing AI query: {query}")
-        result = process_query(collection, query)
+        result = process_query(collection, query, cache=cache)
         print(f"Resultado da Consulta IA: {result}")
     except Exception as e:
         logger.error(f"Error processing AI query: {e}")
@@ -97,9 +357,8 @@ def get_scraping_mode():
 def get_scraping_parameters():
     print("\n=== PARÂMETROS DE COLETA ===")
     
-    base_url = input("Digite a URL do site para coletar: ").strip()
-    if not base_url.startswith(('http://', 'https://')):
-        base_url = 'https://' + base_url
+    seeds = input("Digite a URL do site para coletar (várias separadas por espaço): ").split()
+    seeds = [seed if seed.startswith(('http://', 'https://')) else 'https://' + seed for seed in seeds]
     
     while True:
         try:
@@ -108,30 +367,126 @@ def get_scraping_parameters():
         except ValueError:
             print("Digite um número válido para a profundidade.")
     
+    while True:
+        mode_choice = input("Motor de coleta - 1. Processos, 2. Async, 3. Distribuído (1-3): ").strip()
+        if mode_choice in ("1", "2", "3"):
+            mode = {"1": "process", "2": "async", "3": "distributed"}[mode_choice]
+            break
+        print("Escolha inválida. Digite 1, 2 ou 3.")
+
+    while True:
+        content_choice = input(
+            "Extração de texto - 1. Página inteira, 2. Apenas conteúdo principal (1-2): "
+        ).strip()
+        if content_choice in ("1", "2"):
+            content_mode = "full" if content_choice == "1" else "main"
+            break
+        print("Escolha inválida. Digite 1 ou 2.")
+
+    if mode == "async":
+        prompt = "Digite o número de requisições simultâneas (ex: 200): "
+    elif mode == "distributed":
+        prompt = "Digite o número de workers locais (ex: 4): "
+    else:
+        prompt = "Digite o número de processos (ex: 4): "
     while True:
         try:
-            processes = int(input("Digite o número de processos (ex: 4): ").strip())
+            processes = int(input(prompt).strip())
             break
         except ValueError:
             print("Digite um número válido para processos.")
+
+    # Links are followed inside the seeds unless other domains are given
+    allowed_domains = [
+        domain.lower() for domain in input(
+            "Domínios extras onde seguir links (separados por espaço, Enter para nenhum): "
+        ).split()
+    ]
+    if allowed_domains:
+        allowed_domains += [urlsplit(seed).hostname for seed in seeds if urlsplit(seed).hostname]
     
-    return base_url, max_depth, processes
+    max_pages = None
+    keywords = None
+    use_sitemaps = False
+    requests_per_second = None
+    max_per_host = None
+    if mode == "process":
+        max_pages = get_optional_number("Limite de páginas (Enter para sem limite): ", int)
+        keywords = input("Palavras-chave para priorizar (Enter para nenhuma): ").split() or None
+        use_sitemaps = input("Usar sitemaps do site? (s/n): ").strip().lower() in ("s", "sim")
+        requests_per_second = get_optional_number(
+            "Requisições por segundo por site (Enter para sem limite): ", float
+        )
+        max_per_host = get_optional_number("Requisições simultâneas por site (Enter para sem limite): ", int)
+
+    return (
+        seeds, max_depth, processes, mode, content_mode, max_pages, keywords, use_sitemaps,
+        requests_per_second, max_per_host, allowed_domains or None,
+    )
+
+def get_optional_number(prompt, convert):
+    while True:
+        answer = input(prompt).strip()
+        if not answer:
+            return None
+        try:
+            number = convert(answer)
+            if number > 0:
+                return number
+        except ValueError:
+            pass
+        print("Digite um número positivo ou deixe em branco.")
+
+def search_text(query, per_page=10):
+    logger = get_logger(__name__)
+    logger.info(f"Full-text search: {query}")
+    page = 1
+    while True:
+        try:
+            found = search_pages(query, page, per_page)
+        except ValueError as e:
+            print(f"✗ Consulta inválida: {e}")
+            return
+        if not found['total']:
+            print(f"✗ Nenhuma página encontrada para '{query}'.")
+            return
+        pages = (found['total'] + per_page - 1) // per_page
+        print(f"\n{found['total']} páginas encontradas (página {page} de {pages}):")
+        for position, result in enumerate(found['results'], start=(page - 1) * per_page + 1):
+            print(f"\n{position}. {result['url']}")
+            print(f"   {result['snippet']}")
+        options = []
+        if page < pages:
+            options.append("n = próxima")
+        if page > 1:
+            options.append("p = anterior")
+        if not options:
+            return
+        choice = input(f"\n{', '.join(options)}, Enter para voltar: ").strip().lower()
+        if choice == "n" and page < pages:
+            page += 1
+        elif choice == "p" and page > 1:
+            page -= 1
+        else:
+            return
 
 def main_menu(collection=None):
+    cache = query_cache() if collection is not None else None
     while True:
         print("\n" + "="*50)
         print("           MENU WEB CRAWLER")
         print("="*50)
         print("1. Buscar uma palavra nos dados coletados")
+        print("2. Buscar páginas (texto completo)")
         if collection is not None:
-            print("2. Consulta IA (Busca vetorial)")
+            print("3. Consulta IA (Busca vetorial)")
         else:
-            print("2. Consulta IA (Indisponível - IA não habilitada)")
-        print("3. Limpar todos os bancos de dados")
-        print("4. Sair")
+            print("3. Consulta IA (Indisponível - IA não habilitada)")
+        print("4. Limpar todos os bancos de dados")
+        print("5. Sair")
         print("="*50)
         
-        choice = input("Escolha uma opção (1-4): ").strip()
+        choice = input("Escolha uma opção (1-5): ").strip()
         
         if choice == "1":
             word = input("Digite a palavra para buscar: ").strip()
@@ -139,24 +494,29 @@ def main_menu(collection=None):
                 search_word(word)
         
         elif choice == "2":
+            query = input('Digite a busca (ex: palavra, "frase exata", prefixo*, a OR b): ').strip()
+            if query:
+                search_text(query)
+        
+        elif choice == "3":
             if collection is not None:
                 query = input("Digite sua consulta IA: ").strip()
                 if query:
-                    ai_query(collection, query)
+                    ai_query(collection, query, cache)
             else:
                 print("✗ Consultas IA não estão disponíveis. Execute o scraping com IA habilitada primeiro.")
         
-        elif choice == "3":
+        elif choice == "4":
             confirm = input("Tem certeza que deseja limpar todos os bancos de dados? (s/N): ").strip().lower()
             if confirm == 's':
                 clear_databases()
         
-        elif choice == "4":
+        elif choice == "5":
             print("Até logo!")
             break
         
         else:
-            print("Escolha inválida. Digite 1-4.")
+            print("Escolha inválida. Digite 1-5.")
 
 def main():
     logger = get_logger(__name__)
@@ -166,19 +526,40 @@ def main():
     
     vector_db_enabled = get_scraping_mode()
     
-    base_url, max_depth, processes = get_scraping_parameters()
+    (
+        seeds, max_depth, processes, mode, content_mode, max_pages, keywords, use_sitemaps,
+        requests_per_second, max_per_host, allowed_domains,
+    ) = get_scraping_parameters()
     
     print(f"\n=== INICIANDO COLETA ===")
-    print(f"URL: {base_url}")
+    print(f"URL: {', '.join(seeds)}")
     print(f"Profundidade Máxima: {max_depth}")
-    print(f"Processos: {processes}")
+    print(f"Motor: {mode}")
+    concurrency_labels = {'async': 'Requisições simultâneas', 'distributed': 'Workers locais'}
+    concurrency_label = concurrency_labels.get(mode, 'Processos')
+    print(f"{concurrency_label}: {processes}")
+    print(f"Extração: {'conteúdo principal' if content_mode == 'main' else 'página inteira'}")
+    if allowed_domains:
+        print(f"Domínios permitidos: {', '.join(allowed_domains)}")
+    if max_pages:
+        print(f"Limite de páginas: {max_pages}")
+    if keywords:
+        print(f"Palavras-chave: {', '.join(keywords)}")
+    if use_sitemaps:
+        print("Sitemaps: Sim")
+    if requests_per_second:
+        print(f"Requisições por segundo por site: {requests_per_second}")
+    if max_per_host:
+        print(f"Requisições simultâneas por site: {max_per_host}")
     print(f"IA Habilitada: {'Sim' if vector_db_enabled else 'Não'}")
     
     try:
-        pages = scrape_and_save(base_url, max_depth, processes, vector_db_enabled)
+        collection = scrape_and_save(
+            seeds, max_depth, processes, vector_db_enabled, mode, content_mode, max_pages, keywords, use_sitemaps,
+            requests_per_second, max_per_host, allowed_domains=allowed_domains,
+        )
         
         if vector_db_enabled:
-            collection = setup_vector_db(pages)
             print("✓ Coleta com IA concluída com sucesso!")
         else:
             print("✓ Coleta concluída com sucesso!")
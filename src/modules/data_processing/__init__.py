@@ -1,3 +1,45 @@
-from .web_scrapping import extract_text_and_links
+from .web_scrapping import (
+    TRANSIENT_ERRORS,
+    classify_exception,
+    classify_status,
+    create_connection_stats,
+    error_record,
+    extract_text_and_links,
+    fetch_html,
+    init_session,
+    parse_html,
+    read_connection_stats,
+)
+from .parsers import DEFAULT_BACKEND, available_backends, extract_text_and_hrefs
+from .sitemaps import iter_sitemap_urls, parse_lastmod, sitemap_locations
+from .dedup import DuplicateDetector, content_hash, deduplicate_pages, simhash
+from .urls import BINARY_EXTENSIONS, TRACKING_PARAMS, canonicalize_url, has_binary_extension, in_domains, is_within
 
-__all__ = ['extract_text_and_links']
\ No newline at end of file
+__all__ = [
+    'BINARY_EXTENSIONS',
+    'DEFAULT_BACKEND',
+    'DuplicateDetector',
+    'TRACKING_PARAMS',
+    'TRANSIENT_ERRORS',
+    'available_backends',
+    'canonicalize_url',
+    'classify_exception',
+    'classify_status',
+    'content_hash',
+    'create_connection_stats',
+    'deduplicate_pages',
+    'error_record',
+    'extract_text_and_hrefs',
+    'extract_text_and_links',
+    'fetch_html',
+    'has_binary_extension',
+    'in_domains',
+    'init_session',
+    'is_within',
+    'iter_sitemap_urls',
+    'parse_html',
+    'parse_lastmod',
+    'read_connection_stats',
+    'simhash',
+    'sitemap_locations',
+]
\ No newline at end of file
@@ -0,0 +1,156 @@
+import re
+
+from bs4 import BeautifulSoup, NavigableString
+
+# Subtrees without any visible text
+NON_CONTENT_TAGS = ("script", "style", "noscript", "template", "svg", "iframe")
+
+# Subtrees that usually hold navigation or page chrome
+BOILERPLATE_TAGS = ("nav", "footer", "header", "aside", "form")
+
+# Words in the id/class names of cookie banners, menus, share bars and
+# similar blocks, e.g. "cookie-banner" or "site_footer"
+BOILERPLATE_WORDS = frozenset((
+    "cookie", "cookies", "consent", "banner", "navbar", "menu", "footer", "sidebar", "breadcrumb",
+    "breadcrumbs", "share", "social", "popup", "modal", "newsletter", "advert", "adverts", "advertisement",
+))
+
+# Containers that are never boilerplate
+KEPT_TAGS = ("html", "body", "main", "article")
+
+# A subtree holding more than this share of the page's text is never boilerplate,
+# e.g. a <form> wrapping a whole page or a "layout has-sidebar" wrapper
+MAX_BOILERPLATE_SHARE = 0.5
+
+CONTENT_TAGS = ("p", "pre", "li", "blockquote", "td", "h1", "h2", "h3", "h4", "h5", "h6")
+
+# Blocks with less text than this are not worth scoring
+MIN_BLOCK_LENGTH = 25
+
+
+def _is_boilerplate(tag, names):
+    if tag in BOILERPLATE_TAGS:
+        return True
+    return not names.isspace() and not BOILERPLATE_WORDS.isdisjoint(re.split(r"[^a-z0-9]+", names.lower()))
+
+
+def _length(text):
+    return len(text.strip()) if text else 0
+
+
+def _soup_nodes(soup):
+    """
+    (element, tag, id/class names, parent index, length of its own strings)
+    of every element of a BeautifulSoup tree in document order, root first.
+    """
+    for element in soup.find_all(NON_CONTENT_TAGS):
+        element.decompose()
+    nodes, index = [], {}
+    for element in [soup, *soup.find_all(True)]:
+        index[id(element)] = len(nodes)
+        names = " ".join(element.get("class") or []) + " " + (element.get("id") or "")
+        own = sum(len(child.strip()) for child in element.children if type(child) is NavigableString)
+        nodes.append((element, element.name, names, index[id(element.parent)] if nodes else -1, own))
+    return nodes
+
+
+def _lxml_nodes(root):
+    """
+    Same as _soup_nodes for an lxml.html tree; comments are skipped but
+    their tails belong to their parent.
+    """
+    for element in list(root.iter(NON_CONTENT_TAGS)):
+        if element is not root:
+            element.drop_tree()
+    nodes, index = [], {}
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            continue
+        index[element] = len(nodes)
+        names = (element.get("class") or "") + " " + (element.get("id") or "")
+        own = _length(element.text) + sum(_length(child.tail) for child in element)
+        nodes.append((element, element.tag, names, index[element.getparent()] if nodes else -1, own))
+    return nodes
+
+
+def _lengths(nodes, removed):
+    """
+    Text length of every subtree and the share of it inside links, in one
+    bottom-up pass: children always come after their parent.
+    """
+    lengths = [0 if gone else node[4] for node, gone in zip(nodes, removed)]
+    links = [0] * len(nodes)
+    for i in range(len(nodes) - 1, 0, -1):
+        if removed[i]:
+            continue
+        if nodes[i][1] == "a":
+            links[i] = lengths[i]
+        parent = nodes[i][3]
+        lengths[parent] += lengths[i]
+        links[parent] += links[i]
+    return lengths, links
+
+
+def _main_block(nodes):
+    """
+    Mark the boilerplate nodes and return (removed, index of the best
+    scoring container or None).
+    """
+    removed = [False] * len(nodes)
+    lengths, _ = _lengths(nodes, removed)
+    # Removing a subtree never changes the length of a later one that is not inside it
+    for i, (_, tag, names, parent, _) in enumerate(nodes[1:], start=1):
+        if removed[parent]:
+            removed[i] = True
+        elif tag not in KEPT_TAGS and _is_boilerplate(tag, names):
+            removed[i] = lengths[i] <= MAX_BOILERPLATE_SHARE * lengths[0]
+
+    lengths, links = _lengths(nodes, removed)
+    scores = {}
+
+    def add(i, score):
+        if nodes[i][1] in ("article", "main"):
+            score *= 1.25
+        scores[i] = scores.get(i, 0) + score
+
+    for i, (_, tag, _, parent, _) in enumerate(nodes):
+        if removed[i] or tag not in CONTENT_TAGS or lengths[i] < MIN_BLOCK_LENGTH:
+            continue
+        # Its length discounted by its link density
+        score = lengths[i] - links[i]
+        if parent >= 0:
+            add(parent, score)
+            if nodes[parent][3] >= 0:
+                add(nodes[parent][3], score / 2)
+    return removed, max(scores, key=scores.get) if scores else None
+
+
+def extract_main_content(tree):
+    """
+    Return the text of the block that holds the page's main content.
+
+    `tree` is a BeautifulSoup or lxml.html tree and loses its boilerplate in
+    place: BOILERPLATE_TAGS and elements named with one of
+    BOILERPLATE_WORDS, unless they hold most of the page's text. Every
+    paragraph-like block then adds its length, discounted by its link
+    density, to the score of its parent and half of it to its grandparent;
+    the best scoring container wins. Falls back to the whole cleaned page
+    when no block stands out. Text lengths are computed once per pass over
+    the tree, bottom-up.
+    """
+    soup = isinstance(tree, BeautifulSoup)
+    nodes = _soup_nodes(tree) if soup else _lxml_nodes(tree)
+    removed, best = _main_block(nodes)
+    for (element, _, _, parent, _), gone in zip(nodes, removed):
+        if gone and not removed[parent]:
+            if soup:
+                element.decompose()
+            else:
+                element.drop_tree()
+
+    if soup:
+        block = nodes[best][0] if best is not None else (tree.body or tree)
+        return block.get_text(separator='\n', strip=True)
+    body = tree.find("body")
+    block = nodes[best][0] if best is not None else (tree if body is None else body)
+    return '\n'.join(piece for piece in (text.strip() for text in block.itertext()) if piece)
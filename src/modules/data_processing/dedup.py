@@ -0,0 +1,119 @@
+import hashlib
+import heapq
+import re
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def content_hash(text):
+    """
+    Hash of the page text with whitespace and case normalized.
+    """
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def shingle_hashes(text, bits=64, shingle_size=3):
+    """
+    Hashes of the word shingles of the text.
+    """
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    shingles = [" ".join(tokens[i:i + shingle_size]) for i in range(max(1, len(tokens) - shingle_size + 1))]
+    return [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for shingle in shingles
+    ]
+
+
+def simhash(text, bits=64, shingle_size=3, hashes=None):
+    """
+    SimHash fingerprint over word shingles: near-identical texts differ in few bits.
+    """
+    hashes = shingle_hashes(text, bits, shingle_size) if hashes is None else hashes
+    weights = [0] * bits
+    for value in hashes:
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def resemblance(sketch, other, size):
+    """
+    Estimated Jaccard similarity of two texts' shingles from their bottom-k
+    sketches: the share of the `size` smallest hashes of both that both hold.
+    """
+    union = heapq.nsmallest(size, sketch | other)
+    return sum(1 for value in union if value in sketch and value in other) / len(union) if union else 1.0
+
+
+class DuplicateDetector:
+    """
+    Tracks the pages seen in a crawl and finds exact and near duplicates.
+
+    Fingerprints are split into `max_distance + 1` bands, so any two within
+    `max_distance` bits share at least one band and only pages in the same
+    band bucket are compared. A few bits say little about short or
+    templated pages, so a candidate is only a duplicate once the bottom-k
+    sketches of both (the `sketch_size` smallest shingle hashes) estimate
+    that they share at least `min_resemblance` of their shingles.
+    """
+
+    def __init__(self, max_distance=3, bits=64, min_resemblance=0.9, sketch_size=128):
+        self.max_distance = max_distance
+        self.bits = bits
+        self.min_resemblance = min_resemblance
+        self.sketch_size = sketch_size
+        self.band_count = max_distance + 1
+        self.band_width = bits // self.band_count
+        self._by_hash = {}
+        self._bands = [{} for _ in range(self.band_count)]
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self.band_width) - 1
+        return [(fingerprint >> (band * self.band_width)) & mask for band in range(self.band_count)]
+
+    def find_canonical(self, url, text):
+        """
+        Return the URL this page duplicates, or None after registering it as a new canonical page.
+        """
+        digest = content_hash(text)
+        if digest in self._by_hash:
+            return self._by_hash[digest]
+
+        hashes = shingle_hashes(text, self.bits)
+        fingerprint = simhash(text, self.bits, hashes=hashes)
+        sketch = frozenset(heapq.nsmallest(self.sketch_size, set(hashes)))
+        keys = self._band_keys(fingerprint)
+        for band, key in zip(self._bands, keys):
+            for other_fingerprint, other_url, other_sketch in band.get(key, ()):
+                if (
+                    bin(fingerprint ^ other_fingerprint).count("1") <= self.max_distance
+                    and resemblance(sketch, other_sketch, self.sketch_size) >= self.min_resemblance
+                ):
+                    self._by_hash[digest] = other_url
+                    return other_url
+
+        self._by_hash[digest] = url
+        for band, key in zip(self._bands, keys):
+            band.setdefault(key, []).append((fingerprint, url, sketch))
+        return None
+
+
+def deduplicate_pages(pages, detector=None):
+    """
+    Split (url, text) pages into unique pages and (alias_url, canonical_url) pairs.
+    """
+    detector = detector or DuplicateDetector()
+    unique, aliases = [], []
+    for url, text in pages:
+        canonical = detector.find_canonical(url, text) if text else None
+        if canonical:
+            aliases.append((url, canonical))
+        else:
+            unique.append((url, text))
+    logger.info(f"Deduplication: {len(unique)} unique pages, {len(aliases)} duplicates skipped.")
+    return unique, aliases
@@ -0,0 +1,132 @@
+from bs4 import BeautifulSoup, NavigableString
+
+try:
+    import lxml.html
+except ImportError:  # optional, faster backend
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional, fastest backend
+    LexborHTMLParser = None
+
+SKIPPED_TEXT_TAGS = ("script", "style", "noscript", "template")
+
+
+def available_backends():
+    backends = ["html.parser"]
+    if lxml is not None:
+        backends.append("lxml")
+    if LexborHTMLParser is not None:
+        backends.append("selectolax")
+    return backends
+
+
+# Fastest backend installed, used unless another one is requested
+DEFAULT_BACKEND = available_backends()[-1]
+
+
+def _join(pieces):
+    return '\n'.join(piece for piece in (p.strip() for p in pieces) if piece)
+
+
+def text_and_links_from_soup(soup):
+    """
+    Collect the text and hrefs of a BeautifulSoup tree in a single traversal.
+    """
+    pieces, links = [], []
+    for node in soup.descendants:
+        if type(node) is NavigableString:
+            pieces.append(node)
+        elif node.name == 'a' and node.get('href') is not None:
+            links.append(node['href'])
+    return _join(pieces), links
+
+
+def _lxml_root(html):
+    try:
+        try:
+            return lxml.html.fromstring(html)
+        except ValueError:
+            # str input with an XML encoding declaration must be given as bytes
+            return lxml.html.fromstring(html.encode("utf-8"))
+    except lxml.etree.ParserError:
+        # empty document
+        return None
+
+
+def text_and_links_from_lxml(root):
+    """
+    Collect the text and hrefs of an lxml.html tree in a single traversal.
+    """
+    pieces, links = [], []
+    for element in root.iter():
+        if isinstance(element.tag, str):
+            if element.tag not in SKIPPED_TEXT_TAGS and element.text:
+                pieces.append(element.text)
+            if element.tag == 'a' and element.get('href') is not None:
+                links.append(element.get('href'))
+        if element.tail:
+            pieces.append(element.tail)
+    return _join(pieces), links
+
+
+def _parse_lxml(html):
+    root = _lxml_root(html)
+    return text_and_links_from_lxml(root) if root is not None else ("", [])
+
+
+def _parse_selectolax(html):
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(SKIPPED_TEXT_TAGS))
+    if tree.root is None:
+        return "", []
+    pieces, links = [], []
+    for node in tree.root.traverse(include_text=True):
+        if node.tag == '-text':
+            pieces.append(node.text(deep=False))
+        elif node.tag == 'a':
+            href = node.attributes.get('href')
+            if href is not None:
+                links.append(href)
+    return _join(pieces), links
+
+
+def make_tree(html, backend=DEFAULT_BACKEND):
+    """
+    DOM for callers that need one: an lxml.html tree (None for an empty
+    document) unless the html.parser backend is in use or lxml is missing,
+    then a BeautifulSoup tree.
+    """
+    if backend != 'html.parser' and lxml is not None:
+        return _lxml_root(html)
+    return BeautifulSoup(html, 'html.parser')
+
+
+def text_and_links_from_tree(tree):
+    """
+    Text and hrefs of a tree built by make_tree.
+    """
+    if tree is None:
+        return "", []
+    if isinstance(tree, BeautifulSoup):
+        return text_and_links_from_soup(tree)
+    return text_and_links_from_lxml(tree)
+
+
+def extract_text_and_hrefs(html, backend=DEFAULT_BACKEND):
+    """
+    Return (text, links) of a page using the given parser backend:
+    'html.parser', 'lxml' or 'selectolax'.
+    """
+    if backend == 'selectolax':
+        if LexborHTMLParser is None:
+            raise ValueError("The selectolax backend requires the selectolax package")
+        return _parse_selectolax(html)
+    if backend == 'lxml':
+        if lxml is None:
+            raise ValueError("The lxml backend requires the lxml package")
+        return _parse_lxml(html)
+    if backend == 'html.parser':
+        return text_and_links_from_soup(BeautifulSoup(html, 'html.parser'))
+    raise ValueError(f"Unknown parser backend: {backend}")
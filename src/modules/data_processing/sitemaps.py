@@ -0,0 +1,118 @@
+import gzip
+import io
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import requests
+
+from logger import get_logger
+from .web_scrapping import HEADERS
+
+logger = get_logger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_lastmod(value):
+    """
+    Timestamp of a W3C datetime <lastmod> (e.g. 2024-05-01 or
+    2024-05-01T10:00:00+00:00), None when missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def sitemap_locations(base_url, robots_sitemaps=()):
+    """
+    Sitemaps to read for a site: the ones listed in its robots.txt plus the
+    conventional /sitemap.xml.
+    """
+    parts = urlsplit(base_url)
+    default = f"{parts.scheme}://{parts.netloc}/sitemap.xml"
+    return list(dict.fromkeys([*robots_sitemaps, default]))
+
+
+def _open_stream(response):
+    response.raw.decode_content = True
+    # BufferedReader reads until it gets b"", which an auto-closed raw response refuses
+    response.raw.auto_close = False
+    stream = io.BufferedReader(response.raw)
+    # .xml.gz files are served gzipped without a Content-Encoding header
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def _parse_sitemap(stream):
+    """
+    Yield ('url' | 'sitemap', loc, lastmod) entries of a sitemap or sitemap
+    index, clearing every element once read so memory stays flat.
+    """
+    loc = lastmod = root = None
+    for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            continue
+        name = _local_name(element.tag)
+        # The first <loc> of an entry is the page, later ones belong to extensions such as image:loc
+        if name == "loc" and loc is None:
+            loc = (element.text or "").strip()
+        elif name == "lastmod" and lastmod is None:
+            lastmod = element.text
+        elif name in ("url", "sitemap"):
+            if loc:
+                yield name, loc, parse_lastmod(lastmod)
+            loc = lastmod = None
+            # Drop the entries read so far from the tree
+            root.clear()
+
+
+def iter_sitemap_urls(sitemap_urls, max_sitemaps=1000, timeout=10):
+    """
+    Yield (url, lastmod timestamp or None) for every page listed in the given
+    sitemaps, following sitemap indexes. Gzipped sitemaps are supported and
+    every file is parsed while it downloads. Sitemaps that cannot be fetched
+    or parsed are skipped.
+    """
+    pending = deque(sitemap_urls)
+    seen = set(pending)
+    read = 0
+    with requests.Session() as session:
+        session.headers.update(HEADERS)
+        session.verify = False
+        while pending and read < max_sitemaps:
+            sitemap_url = pending.popleft()
+            read += 1
+            pages = 0
+            try:
+                with session.get(sitemap_url, timeout=timeout, stream=True) as response:
+                    if not response.ok:
+                        logger.info(f"No sitemap at {sitemap_url} (HTTP {response.status_code})")
+                        continue
+                    for kind, loc, lastmod in _parse_sitemap(_open_stream(response)):
+                        if kind == "sitemap":
+                            if loc not in seen:
+                                seen.add(loc)
+                                pending.append(loc)
+                        else:
+                            pages += 1
+                            yield loc, lastmod
+            except (requests.RequestException, ElementTree.ParseError, OSError, EOFError) as e:
+                logger.warning(f"Could not read sitemap {sitemap_url}: {e}")
+            logger.info(f"Sitemap {sitemap_url}: {pages} pages")
+    if pending:
+        logger.warning(f"Sitemap limit of {max_sitemaps} reached, {len(pending)} sitemaps not read")
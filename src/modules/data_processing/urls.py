@@ -0,0 +1,111 @@
+import posixpath
+from fnmatch import fnmatch
+from urllib.parse import unquote_plus, urljoin, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Query parameters that only track the visitor and never change the page.
+TRACKING_PARAMS = (
+    "utm_*",
+    "gclid",
+    "fbclid",
+    "msclkid",
+    "mc_cid",
+    "mc_eid",
+    "_ga",
+    "_hsenc",
+    "_hsmi",
+)
+
+# Link targets that are never HTML pages
+BINARY_EXTENSIONS = frozenset((
+    ".pdf", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".tar",
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".ico", ".bmp", ".tif", ".tiff",
+    ".mp3", ".mp4", ".m4a", ".wav", ".ogg", ".webm", ".avi", ".mov", ".mkv",
+    ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".odt", ".ods",
+    ".exe", ".msi", ".dmg", ".iso", ".apk", ".bin", ".jar",
+    ".css", ".js", ".json", ".woff", ".woff2", ".ttf", ".eot",
+))
+
+
+def _normalize_path(path):
+    if not path:
+        return "/"
+    normalized = posixpath.normpath(path)
+    # POSIX treats a leading "//" specially, URLs do not
+    if normalized.startswith("//"):
+        normalized = "/" + normalized.lstrip("/")
+    if normalized == ".":
+        return "/"
+    # /docs/ and /docs are different resources to most servers, and fetching
+    # one for the other costs a redirect
+    if path.endswith("/") and normalized != "/":
+        normalized += "/"
+    return normalized
+
+
+def _normalize_query(query, drop_params, keep_params):
+    # Parameters are kept as written, so a valueless "?action" is not turned into "?action="
+    params = [param for param in query.split("&") if param]
+    names = {param: unquote_plus(param.split("=", 1)[0]) for param in params}
+    if keep_params is not None:
+        params = [param for param in params if any(fnmatch(names[param], pattern) for pattern in keep_params)]
+    params = [param for param in params if not any(fnmatch(names[param], pattern) for pattern in drop_params)]
+    return "&".join(sorted(params))
+
+
+def canonicalize_url(link, page_url=None, drop_params=TRACKING_PARAMS, keep_params=None):
+    """
+    Resolve `link` against the page it was found on and return its canonical form.
+
+    Scheme and host are lowercased, default ports, fragments and dot segments
+    are removed, and query parameters are filtered (names matching
+    `drop_params` are removed; when `keep_params` is given, only matching
+    names are kept) and sorted. Trailing slashes and parameter spelling are
+    kept, so the canonical URL is still the one to request. Returns None for
+    non-HTTP links such as mailto: or javascript:.
+    """
+    url = urljoin(page_url, link.strip()) if page_url else link.strip()
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+
+    host = parts.hostname.lower().rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        return None
+    netloc = host if port in (None, DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+
+    path = _normalize_path(parts.path)
+    query = _normalize_query(parts.query, drop_params, keep_params)
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def is_within(url, base_url):
+    """
+    Whether canonical `url` is `base_url` itself or a page below it.
+    """
+    prefix = base_url.rstrip("/")
+    return url == base_url or url.startswith(prefix + "/") or url.startswith(prefix + "?")
+
+
+def has_binary_extension(url):
+    """
+    Whether the path of `url` ends in an extension of a known binary or asset file.
+    """
+    _, extension = posixpath.splitext(urlsplit(url).path)
+    return extension.lower() in BINARY_EXTENSIONS
+
+
+def in_domains(url, domains):
+    """
+    Whether the host of `url` is one of `domains` or a subdomain of one.
+    """
+    host = urlsplit(url).hostname or ""
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
@@ -1,34 +1,314 @@
 
 import os
+import re
+import socket
 import sys
 import time
+from email.utils import parsedate_to_datetime
+import httpx
 import requests
-from bs4 import BeautifulSoup
-from multiprocessing import current_process
+from multiprocessing import Value, current_process
+from requests.adapters import HTTPAdapter
 from logger import get_logger
+from .content_extraction import extract_main_content
+from .dedup import content_hash
+from .parsers import DEFAULT_BACKEND, extract_text_and_hrefs, make_tree, text_and_links_from_tree
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 logger = get_logger(__name__)
 
-def extract_text_and_links(url):
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
-        ),
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Connection": "keep-alive"
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+    ),
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Connection": "keep-alive"
+}
+
+# Largest response body read, anything longer is truncated
+MAX_BYTES = 5 * 1024 * 1024
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+# Back-off used when a server rate limits without a usable Retry-After
+DEFAULT_RETRY_AFTER = 30
+
+# Failure classes worth another attempt later; 'dns', 'http_4xx',
+# 'redirects' and 'other' are final
+TRANSIENT_ERRORS = ("timeout", "connection", "http_5xx", "rate_limited")
+
+_session = None
+_adapter = None
+_connection_stats = None
+
+
+def create_connection_stats():
+    """
+    Shared counters of requests served on new versus reused connections,
+    passed to init_session by every worker of a pool.
+    """
+    return {"new": Value('i', 0), "reused": Value('i', 0)}
+
+
+def read_connection_stats(connection_stats):
+    return {name: counter.value for name, counter in connection_stats.items()}
+
+
+def init_session(connection_stats=None, pool_size=10):
+    """
+    Pool initializer: create the keep-alive session reused by every request of this process.
+    """
+    global _session, _adapter, _connection_stats
+    _adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    _session = requests.Session()
+    _session.headers.update(HEADERS)
+    _session.verify = False
+    _session.mount("http://", _adapter)
+    _session.mount("https://", _adapter)
+    _connection_stats = connection_stats
+
+
+def get_session():
+    if _session is None:
+        init_session()
+    return _session
+
+
+def _opened_connections():
+    pools = _adapter.poolmanager.pools
+    return sum(pools[key].num_connections for key in pools.keys())
+
+
+def _count_connection(opened_before):
+    if _connection_stats is None:
+        return
+    counter = _connection_stats["new" if _opened_connections() > opened_before else "reused"]
+    with counter.get_lock():
+        counter.value += 1
+
+
+def parse_html(url, html, content_mode="full", parser_backend=DEFAULT_BACKEND):
+    """
+    Parse a page into {'url', 'text', 'links', 'bytes_removed'}.
+
+    Text and links are collected in one traversal by `parser_backend`. With
+    content_mode="main" only the main content block is kept as text (links
+    still come from the whole page) and `bytes_removed` tells how much
+    boilerplate text was dropped; a page where no main content is found
+    keeps its full text.
+    """
+    bytes_removed = 0
+    if content_mode == "main":
+        tree = make_tree(html, parser_backend)
+        full_text, links = text_and_links_from_tree(tree)
+        text = (extract_main_content(tree) if tree is not None else "") or full_text
+        bytes_removed = len(full_text.encode("utf-8")) - len(text.encode("utf-8"))
+    else:
+        text, links = extract_text_and_hrefs(html, parser_backend)
+    return {'url': url, 'text': text, 'links': links, 'bytes_removed': bytes_removed}
+
+
+def is_html(content_type):
+    """
+    Whether a Content-Type header announces HTML; a missing header is given the benefit of the doubt.
+    """
+    if not content_type:
+        return True
+    return content_type.split(";")[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+def decode_body(body, content_type):
+    """
+    Decode a response body with the charset declared in the Content-Type
+    header or in a <meta> tag, falling back to UTF-8.
+    """
+    charset = None
+    for param in (content_type or "").split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            charset = value.strip().strip('"\'')
+    if not charset:
+        match = META_CHARSET_PATTERN.search(body[:2048])
+        charset = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return body.decode(charset, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def retry_after_seconds(value, default=DEFAULT_RETRY_AFTER):
+    """
+    Seconds to wait from a Retry-After header, given either as a number of
+    seconds or as an HTTP date.
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+def classify_exception(error):
+    """
+    Failure class of an exception raised by requests or httpx: 'timeout',
+    'dns', 'connection', 'redirects' or 'other'.
+    """
+    if isinstance(error, (requests.Timeout, httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+    if isinstance(error, (requests.TooManyRedirects, httpx.TooManyRedirects)):
+        return "redirects"
+    if isinstance(error, (requests.ConnectionError, httpx.TransportError, ConnectionError)):
+        cause = error
+        while cause is not None:
+            if isinstance(cause, socket.gaierror):
+                return "dns"
+            cause = cause.__cause__ or cause.__context__
+        return "connection"
+    return "other"
+
+
+def classify_status(status_code):
+    """
+    Failure class of an HTTP status code, None when it is not an error.
+    """
+    if status_code == 429:
+        return "rate_limited"
+    if status_code >= 500:
+        return "http_5xx"
+    if status_code >= 400:
+        return "http_4xx"
+    return None
+
+
+def error_record(url, error, http_status=None, retry_after=None):
+    return {
+        'url': url,
+        'text': "",
+        'links': [],
+        'status': "error",
+        'error': error,
+        'http_status': http_status,
+        'retry_after': retry_after,
     }
 
+
+def _conditional_headers(validators):
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def _read_body(chunks, max_bytes):
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        if len(body) > max_bytes:
+            return bytes(body[:max_bytes]), True
+    return bytes(body), False
+
+
+def extract_text_and_links(
+    url, validators=None, content_mode="full", parser_backend=DEFAULT_BACKEND, max_bytes=MAX_BYTES,
+):
+    """
+    Fetch and parse a page into a {'url', 'text', 'links', 'status', ...} record.
+
+    `validators` holds the ETag and Last-Modified of a previous fetch; when the
+    server answers 304 the page is not parsed and its status is 'not_modified'.
+    Failed fetches have status 'error', their failure class in 'error' (see
+    classify_exception and classify_status) and, when the server asked for
+    it, the seconds to wait in 'retry_after'.
+    Non-HTML responses are dropped from their headers with status 'skipped',
+    and bodies are streamed and cut at `max_bytes`. `content_mode` and
+    `parser_backend` are passed to parse_html.
+    """
     try:
         start = time.time()
-        response = requests.get(url, headers=headers, verify=False, timeout=10)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        text = soup.get_text(separator='\n', strip=True)
-        links = [a['href'] for a in soup.find_all('a', href=True)]
+        session = get_session()
+        opened_before = _opened_connections()
+        response = session.get(url, headers=_conditional_headers(validators), timeout=10, stream=True)
+        _count_connection(opened_before)
+        record = {
+            'url': response.url,
+            'text': "",
+            'links': [],
+            'status': "ok",
+            'etag': response.headers.get("ETag"),
+            'last_modified': response.headers.get("Last-Modified"),
+        }
+        content_type = response.headers.get("Content-Type")
+        if response.status_code == 304:
+            response.close()
+            record['status'] = "not_modified"
+            logger.info(f"[{current_process().name}] Not modified: {url}")
+            return record
+        error = classify_status(response.status_code)
+        if error:
+            response.close()
+            retry_after = response.headers.get("Retry-After")
+            if error == "rate_limited" or retry_after:
+                retry_after = retry_after_seconds(retry_after)
+            logger.warning(f"[{current_process().name}] HTTP {response.status_code} on {url}")
+            return error_record(response.url, error, response.status_code, retry_after)
+        if not is_html(content_type):
+            response.close()
+            record['status'] = "skipped"
+            logger.info(f"[{current_process().name}] Skipped {url}: {content_type}")
+            return record
+        body, truncated = _read_body(response.iter_content(chunk_size=65536), max_bytes)
+        response.close()
+        if truncated:
+            logger.warning(f"[{current_process().name}] Truncated {url} at {max_bytes} bytes")
+        html = decode_body(body, content_type)
+        record.update(parse_html(response.url, html, content_mode, parser_backend))
+        record['content_hash'] = content_hash(record['text'])
         elapsed = time.time() - start
-        logger.info(f"[{current_process().name}] Scraped {url} in {elapsed:.2f}s, found {len(links)} links.")
-        return url, text, links
+        logger.info(f"[{current_process().name}] Scraped {url} in {elapsed:.2f}s, found {len(record['links'])} links.")
+        return record
+    except Exception as e:
+        error = classify_exception(e)
+        logger.error(f"[{current_process().name}] Error ({error}) with {url}: {e}")
+        return error_record(url, error)
+
+
+async def fetch_html(client, url, max_bytes=MAX_BYTES):
+    """
+    Fetch a page with a shared httpx.AsyncClient, returning its final URL
+    after redirects, its HTML, a status ('ok', 'skipped' for non-HTML
+    responses or 'error', both without HTML) and the failure class of an
+    error. Bodies are cut at `max_bytes`.
+    """
+    try:
+        async with client.stream("GET", url, headers=HEADERS, timeout=10) as response:
+            final_url = str(response.url)
+            error = classify_status(response.status_code)
+            if error:
+                logger.warning(f"[async] HTTP {response.status_code} on {url}")
+                return final_url, None, "error", error
+            content_type = response.headers.get("Content-Type")
+            if not is_html(content_type):
+                logger.info(f"[async] Skipped {url}: {content_type}")
+                return final_url, None, "skipped", None
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > max_bytes:
+                    logger.warning(f"[async] Truncated {url} at {max_bytes} bytes")
+                    del body[max_bytes:]
+                    break
+        return final_url, decode_body(bytes(body), content_type), "ok", None
     except Exception as e:
-        logger.error(f"[{current_process().name}] Error with {url}: {e}")
-        return url, "", []
+        error = classify_exception(e)
+        logger.error(f"[async] Error ({error}) with {url}: {e}")
+        return url, None, "error", error
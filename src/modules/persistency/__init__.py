@@ -1,38 +1,77 @@
 # __init__.py
 
 from .text_storage import (
+    PageWriter,
+    close_connections,
     create_database_file,
     setup_database,
     save_page,
     wipe_database,
     count_words,
+    get_page,
+    search_pages,
+    search_passages,
     save_many_pages,
+    insert_pages,
+    delete_pages,
+    save_aliases,
+    save_fetch_errors,
 )
 
+from .crawl_state import CrawlState
+from .shared_frontier import SharedFrontier
+from .embedding_cache import EmbeddingCache
+from .retrieval import hybrid_search, reciprocal_rank_fusion
+from .query_cache import QueryCache, collection_version
+
 from .vector_storage import (
     OllamaEmbeddingFunction,
     get_prompt,
     get_ollama_response,
     initialize_chromadb,
     create_collection,
+    chunk_id,
     split_into_chunks,
+    sync_chunks,
+    missing_sources,
+    delete_sources,
     populate_collection,
     process_query,
 
 )
 __all__ = [
+    "CrawlState",
+    "PageWriter",
+    "close_connections",
+    "SharedFrontier",
+    "EmbeddingCache",
+    "QueryCache",
+    "collection_version",
     "create_database_file",
     "setup_database",
     "save_page",
     "wipe_database",
     "count_words",
+    "get_page",
+    "search_pages",
+    "search_passages",
+    "hybrid_search",
+    "reciprocal_rank_fusion",
     "OllamaEmbeddingFunction",
     "get_prompt",
     "get_ollama_response",
     "initialize_chromadb",
     "create_collection",
+    "chunk_id",
     "split_into_chunks",
+    "sync_chunks",
+    "missing_sources",
+    "delete_sources",
     "populate_collection",
     "process_query",
     "save_many_pages",
+    "insert_pages",
+    "delete_pages",
+    "save_aliases",
+    "save_fetch_errors",
 ]
@@ -0,0 +1,260 @@
+import json
+import time
+
+from logger import get_logger
+from .text_storage import DB_PATH, PageWriter, create_database_file, open_connection
+
+logger = get_logger(__name__)
+
+# HTTP statuses meaning a page was removed; other failures keep the page
+GONE_STATUSES = (404, 410)
+
+
+def _push(conn, run_id, entries):
+    conn.executemany(
+        "INSERT OR IGNORE INTO crawl_frontier (run_id, url, depth) VALUES (?, ?, ?)",
+        [(run_id, url, depth) for url, depth in entries],
+    )
+
+
+def _log(conn, run_id, records):
+    conn.executemany(
+        "DELETE FROM crawl_frontier WHERE run_id = ? AND url = ?",
+        [(run_id, record["requested_url"]) for record in records],
+    )
+    now = time.time()
+    conn.executemany("""
+        INSERT INTO crawl_log (url, run_id, etag, last_modified, content_hash, links, fetched_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (url) DO UPDATE SET
+            run_id = excluded.run_id,
+            http_status = NULL,
+            -- A page without a content hash had its text not stored: drop its validators
+            etag = CASE WHEN excluded.content_hash IS NULL THEN NULL ELSE coalesce(excluded.etag, crawl_log.etag) END,
+            last_modified = CASE WHEN excluded.content_hash IS NULL THEN NULL
+                ELSE coalesce(excluded.last_modified, crawl_log.last_modified) END,
+            content_hash = excluded.content_hash,
+            links = excluded.links,
+            fetched_at = excluded.fetched_at
+    """, [
+        (
+            record["url"], run_id, record.get("etag"), record.get("last_modified"),
+            record.get("content_hash"), json.dumps(record["links"]), now,
+        )
+        for record in records if record["status"] != "error"
+    ])
+    # A failed fetch keeps the validators and text of the last good one
+    conn.executemany("""
+        INSERT INTO crawl_log (url, run_id, links, fetched_at, http_status)
+        VALUES (?, ?, '[]', 0, ?)
+        ON CONFLICT (url) DO UPDATE SET run_id = excluded.run_id, http_status = excluded.http_status
+    """, [
+        (record["url"], run_id, record.get("http_status"))
+        for record in records if record["status"] == "error"
+    ])
+
+
+def _end_run(conn, run_id, removed):
+    conn.execute("UPDATE crawl_runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+    conn.execute("DELETE FROM crawl_frontier WHERE run_id = ?", (run_id,))
+    conn.executemany("DELETE FROM crawl_log WHERE url = ?", [(url,) for url in removed])
+
+
+def _migrate_frontier(conn):
+    # The frontier used to be a single table shared by every run; it belongs
+    # to the latest unfinished run, the only one that could resume from it
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(crawl_frontier)")}
+    if not columns or "run_id" in columns:
+        return
+    conn.execute("ALTER TABLE crawl_frontier RENAME TO crawl_frontier_legacy")
+    conn.execute("""
+        CREATE TABLE crawl_frontier (
+            run_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (run_id, url)
+        )
+    """)
+    conn.execute("""
+        INSERT INTO crawl_frontier (run_id, url, depth)
+        SELECT run_id, url, depth FROM crawl_frontier_legacy, (
+            SELECT max(run_id) AS run_id FROM crawl_runs WHERE finished_at IS NULL
+        ) WHERE run_id IS NOT NULL
+    """)
+    conn.execute("DROP TABLE crawl_frontier_legacy")
+
+
+class CrawlState:
+    """
+    Crawl frontier, visited set and HTTP validators persisted in SQLite.
+
+    A run that did not reach finish() is resumed from its saved frontier by
+    the next start() from the same seeds. A finished site is recrawled with
+    conditional requests built from the stored ETag and Last-Modified
+    values, and pages whose content hash did not change are reported as
+    unchanged.
+
+    Every write goes through `writer`, the PageWriter storing the pages, so
+    the crawl state never holds a write transaction of its own and a URL is
+    never marked done before its page is committed.
+    """
+
+    def __init__(self, writer=None, db_path=DB_PATH):
+        create_database_file(db_path)
+        self._owns_writer = writer is None
+        self.writer = PageWriter(db_path, commit_every=50) if writer is None else writer
+        # Only read from; autocommit reads never hold a lock
+        self.conn = open_connection(db_path)
+        self.run_id = None
+        self.base_url = None
+        self.finished = False
+        with self.writer.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    base_url TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    finished_at REAL
+                )
+            """)
+            _migrate_frontier(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_frontier (
+                    run_id INTEGER NOT NULL,
+                    url TEXT NOT NULL,
+                    depth INTEGER NOT NULL,
+                    PRIMARY KEY (run_id, url)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_log (
+                    url TEXT PRIMARY KEY,
+                    run_id INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_hash TEXT,
+                    links TEXT,
+                    fetched_at REAL NOT NULL,
+                    http_status INTEGER
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(crawl_log)")}
+            if "http_status" not in columns:
+                conn.execute("ALTER TABLE crawl_log ADD COLUMN http_status INTEGER")
+
+    def start(self, seeds):
+        """
+        Return the (url, depth) frontier to crawl: the saved one if the last run
+        from the same seed URL(s) was interrupted, otherwise just the seeds.
+        """
+        seeds = [seeds] if isinstance(seeds, str) else sorted(seeds)
+        self.base_url = " ".join(seeds)
+        row = self.conn.execute(
+            "SELECT run_id FROM crawl_runs WHERE base_url = ? AND finished_at IS NULL ORDER BY run_id DESC LIMIT 1",
+            (self.base_url,),
+        ).fetchone()
+        if row:
+            self.run_id = row[0]
+            frontier = self.conn.execute(
+                "SELECT url, depth FROM crawl_frontier WHERE run_id = ?", (self.run_id,)
+            ).fetchall()
+            logger.info(f"Resuming crawl run {self.run_id} with {len(frontier)} URLs in the frontier.")
+            return frontier
+
+        frontier = [(seed, 0) for seed in seeds]
+        with self.writer.transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO crawl_runs (base_url, started_at) VALUES (?, ?)", (self.base_url, time.time())
+            )
+            self.run_id = cur.lastrowid
+            _push(conn, self.run_id, frontier)
+        return frontier
+
+    def visited_urls(self):
+        """
+        URLs already fetched by the current run.
+        """
+        rows = self.conn.execute("SELECT url FROM crawl_log WHERE run_id = ?", (self.run_id,))
+        return [url for (url,) in rows]
+
+    def validators(self, url):
+        row = self.conn.execute("SELECT etag, last_modified FROM crawl_log WHERE url = ?", (url,)).fetchone()
+        if not row or not any(row):
+            return None
+        return {"etag": row[0], "last_modified": row[1]}
+
+    def fetched_since(self, url, timestamp):
+        """
+        Whether `url` was fetched at or after `timestamp`, e.g. its sitemap <lastmod>.
+        """
+        row = self.conn.execute("SELECT fetched_at FROM crawl_log WHERE url = ?", (url,)).fetchone()
+        return row is not None and row[0] >= timestamp
+
+    def push_many(self, entries):
+        entries = list(entries)
+        if entries:
+            self.writer.defer(_push, self.run_id, entries)
+
+    def complete(self, requested_url, record):
+        """
+        Settle the status of a fetched page and return its record.
+
+        A 304 reuses the links stored by the previous fetch and a page with an
+        unchanged content hash is marked 'unchanged'. Nothing is written: pass
+        the record to log() once the page is stored.
+        """
+        previous = self.conn.execute(
+            "SELECT content_hash, links FROM crawl_log WHERE url = ?", (record["url"],)
+        ).fetchone()
+        if record["status"] == "not_modified" and previous:
+            record["content_hash"] = previous[0]
+            record["links"] = json.loads(previous[1] or "[]")
+        elif record["status"] == "ok" and previous and previous[0] == record.get("content_hash"):
+            record["status"] = "unchanged"
+        record["requested_url"] = requested_url
+        return record
+
+    def log(self, records):
+        """
+        Mark completed records as done: drop them from the frontier and keep
+        their validators for the next crawl. Call it once their pages are
+        stored (and embedded): the writes queue behind the page writes, so
+        an interrupted crawl fetches again every page it had not saved.
+        """
+        records = [record for record in records if "requested_url" in record]
+        if records:
+            self.writer.defer(_log, self.run_id, records, size=len(records))
+
+    def finish(self):
+        """
+        Note that the crawl went through its whole frontier; end_run() saves it.
+        """
+        self.finished = True
+
+    def stale_urls(self):
+        """
+        URLs of the current, finished crawl's seeds whose pages are gone: not
+        reached anymore, or answered with a GONE_STATUSES status. Pages of
+        other seeds and pages failing for any other reason are kept.
+        """
+        if not self.finished:
+            return []
+        rows = self.conn.execute(f"""
+            SELECT crawl_log.url FROM crawl_log JOIN crawl_runs ON crawl_runs.run_id = crawl_log.run_id
+            WHERE crawl_runs.base_url = ?
+                AND (crawl_log.run_id < ? OR crawl_log.http_status IN ({", ".join("?" * len(GONE_STATUSES))}))
+        """, (self.base_url, self.run_id, *GONE_STATUSES))
+        return [url for (url,) in rows]
+
+    def end_run(self, removed=()):
+        """
+        Mark a finished run as done once all of its pages are stored, dropping
+        its frontier and forgetting the `removed` URLs.
+        """
+        self.writer.defer(_end_run, self.run_id, list(removed))
+        self.writer.flush()
+
+    def close(self):
+        if self._owns_writer:
+            self.writer.close()
+        self.conn.close()
@@ -0,0 +1,114 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Path to the SQLite embedding cache
+CACHE_PATH = Path("data/embedding_cache.db")
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model name, hash of the text).
+
+    Vectors are stored as float32 blobs. Once more than `max_entries` are
+    stored, the least recently used ones are evicted. Safe to share between
+    threads; the connection is reopened after pickling.
+    """
+
+    def __init__(self, db_path=CACHE_PATH, max_entries=500_000):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                );
+                CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+            """)
+            self._size = self._conn.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+        return self._conn
+
+    def get_many(self, model, texts):
+        """
+        Return {index in texts: vector} for the texts already cached.
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for index, digest in enumerate(hashes):
+                row = conn.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?", (model, digest)
+                ).fetchone()
+                if row:
+                    found[index] = array("f", row[0]).tolist()
+            now = time.time()
+            conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(now, model, hashes[index]) for index in found],
+            )
+            conn.commit()
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = [
+            (model, text_hash(text), array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            conn = self._connection()
+            cur = conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._size += cur.rowcount
+            if self._size > self.max_entries:
+                excess = self._size - self.max_entries
+                conn.execute("""
+                    DELETE FROM embeddings WHERE rowid IN (
+                        SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?
+                    )
+                """, (excess,))
+                self._size -= excess
+                logger.info(f"Cache de embeddings: {excess} entradas removidas (LRU)")
+            conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
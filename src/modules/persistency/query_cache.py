@@ -0,0 +1,211 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from logger import get_logger
+from .text_storage import get_connection
+
+logger = get_logger(__name__)
+
+# Path to the SQLite query cache
+QUERY_CACHE_PATH = Path("data/query_cache.db")
+
+
+def _key(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def collection_version(collection):
+    """
+    Fingerprint of the indexed data: chunks in the collection plus count and
+    last fetch of the pages. A crawl that adds, changes or removes anything
+    changes it.
+    """
+    pages, last_fetch = get_connection().execute("SELECT count(*), max(fetched_at) FROM pages").fetchone()
+    return f"{collection.count()}:{pages}:{last_fetch}"
+
+
+class QueryCache:
+    """
+    On-disk cache of the question answering path, in layers:
+
+    - retrievals, keyed by the exact query string and the search parameters;
+    - answers, keyed by the query, the model and the IDs of the retrieved chunks;
+    - optionally, answers to similar queries: when `embedding_function` is
+      given, a query whose embedding has a cosine similarity of at least
+      `similarity` with a cached query gets that query's answer.
+
+    Entries expire after `ttl` seconds, the least recently used are evicted
+    past `max_entries` per layer, and everything is dropped once the
+    collection_version changes.
+    """
+
+    def __init__(self, db_path=QUERY_CACHE_PATH, ttl=24 * 3600, max_entries=1000,
+                 embedding_function=None, similarity=0.95):
+        self.db_path = Path(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embedding_function = embedding_function
+        self.similarity = similarity
+        # Per question: answered from cache (exactly or by similarity) or by the model
+        self.hits = {"answer": 0, "semantic": 0}
+        self.misses = 0
+        # Retrievals reused, whether or not the answer was cached too
+        self.retrieval_hits = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self):
+        return self.embedding_function is not None
+
+    def _connection(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS retrievals (
+                    key TEXT PRIMARY KEY,
+                    hits TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    embedding BLOB,
+                    answer TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                );
+            """)
+        return self._conn
+
+    def validate(self, version):
+        """
+        Drop every entry if the data changed since they were stored.
+        """
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM cache_meta WHERE key = 'version'").fetchone()
+            if row and row[0] == version:
+                return
+            with conn:
+                conn.execute("DELETE FROM retrievals")
+                conn.execute("DELETE FROM answers")
+                conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('version', ?)", (version,))
+            if row:
+                logger.info("Cache de consultas invalidado: a coleção mudou")
+
+    def clear(self):
+        with self._lock, self._connection() as conn:
+            conn.execute("DELETE FROM retrievals")
+            conn.execute("DELETE FROM answers")
+            conn.execute("DELETE FROM cache_meta")
+
+    def _get(self, conn, table, column, key):
+        row = conn.execute(f"SELECT {column}, created FROM {table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        with conn:
+            if now - row[1] > self.ttl:
+                conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+                return None
+            conn.execute(f"UPDATE {table} SET last_used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def _evict(self, conn, table):
+        conn.execute(f"DELETE FROM {table} WHERE created < ?", (time.time() - self.ttl,))
+        excess = conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(f"""
+                DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM {table} ORDER BY last_used LIMIT ?
+                )
+            """, (excess,))
+
+    def get_retrieval(self, query, params):
+        with self._lock:
+            hits = self._get(self._connection(), "retrievals", "hits", _key(query, params))
+        if hits is None:
+            return None
+        self.retrieval_hits += 1
+        return json.loads(hits)
+
+    def put_retrieval(self, query, params, hits):
+        now = time.time()
+        with self._lock, self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO retrievals (key, hits, created, last_used) VALUES (?, ?, ?, ?)",
+                (_key(query, params), json.dumps(hits), now, now),
+            )
+            self._evict(conn, "retrievals")
+
+    @staticmethod
+    def _answer_key(query, model, hits):
+        # Chunks only found by BM25 in pages without chunks have no ID
+        return _key(query, model, [hit['id'] or hit['url'] for hit in hits])
+
+    def get_answer(self, query, model, hits):
+        with self._lock:
+            answer = self._get(self._connection(), "answers", "answer", self._answer_key(query, model, hits))
+        if answer is not None:
+            self.hits["answer"] += 1
+        return answer
+
+    def embed(self, query):
+        return self.embedding_function([query])[0]
+
+    def similar_answer(self, embedding):
+        """
+        Answer of the cached query most similar to this embedding, if similar enough.
+        """
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT query, embedding, answer FROM answers WHERE embedding IS NOT NULL AND created >= ?",
+                (time.time() - self.ttl,),
+            ).fetchall()
+        if not rows:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        scores = matrix @ vector / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector) + 1e-12)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        self.hits["semantic"] += 1
+        logger.info(f"Cache semântico: usando a resposta de '{rows[best][0]}' (similaridade {scores[best]:.3f})")
+        return rows[best][2]
+
+    def put_answer(self, query, model, hits, answer, embedding=None):
+        self.misses += 1
+        now = time.time()
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self._lock, self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, query, embedding, answer, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (self._answer_key(query, model, hits), query, blob, answer, now, now),
+            )
+            self._evict(conn, "answers")
+
+    def stats(self):
+        """
+        Questions answered from the cache and by the model, the share of the
+        former, and retrievals reused.
+        """
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        return {
+            **self.hits, "misses": self.misses, "hit_rate": hits / total if total else 0.0,
+            "retrieval_hits": self.retrieval_hits,
+        }
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import get_logger
+from .text_storage import match_any, search_passages
+
+logger = get_logger(__name__)
+
+# Weight of each ranking in the fusion
+DEFAULT_WEIGHTS = {"fts": 1.0, "dense": 1.0}
+
+# Shared by every search: its threads, and the SQLite connection each one
+# opens through get_connection, live as long as the process
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="retrieval")
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """
+    Fuse ranked lists of keys, {source: [key, ...]}, into [(key, score)]
+    best first. Every list adds weight / (k + rank) to the keys it holds;
+    a larger `k` flattens the advantage of the top ranks.
+    """
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    scores = {}
+    for source, keys in rankings.items():
+        weight = weights.get(source, 1.0)
+        for rank, key in enumerate(keys, start=1):
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def dense_search(collection, query, n_results, query_embedding=None):
+    # A precomputed embedding saves Chroma from embedding the query again
+    if query_embedding is not None:
+        target = {"query_embeddings": [query_embedding]}
+    else:
+        target = {"query_texts": [query]}
+    results = collection.query(**target, n_results=n_results, include=["documents", "metadatas"])
+    return [
+        {'id': id_, 'url': meta.get("source"), 'text': document}
+        for id_, document, meta in zip(results["ids"][0], results["documents"][0], results["metadatas"][0])
+    ]
+
+
+def _best_chunk(collection, url, query):
+    # Chunk of a page found only by BM25 that shares the most words with the query
+    stored = collection.get(where={"source": url}, include=["documents"])
+    if not stored["ids"]:
+        return None
+    terms = set(match_any(query).replace('"', "").split(" OR "))
+    overlap = [len(terms & set(document.lower().split())) for document in stored["documents"]]
+    best = max(range(len(overlap)), key=overlap.__getitem__)
+    return {'id': stored["ids"][best], 'url': url, 'text': stored["documents"][best]}
+
+
+def _ranked(name, search, *args):
+    try:
+        return search(*args)
+    except Exception as e:
+        logger.warning(f"Busca {name} falhou, seguindo sem ela: {e}")
+        return []
+
+
+def hybrid_search(collection, query, n_results=3, candidates=20, k=60, weights=None, query_embedding=None):
+    """
+    Retrieve the `n_results` most relevant chunks for a query.
+
+    The FTS5 index (BM25) and the Chroma collection (dense similarity) are
+    searched concurrently for `candidates` results each; pages are fused
+    with reciprocal rank fusion (`k`, per-source `weights`). Each result is
+    {'id', 'url', 'text', 'score'}: the best dense chunk of the page, or
+    for pages only BM25 found, the chunk sharing most words with the query
+    (the FTS passage, with id None, when the page has no chunks).
+    `query_embedding` is used for the dense search when already known.
+    """
+    dense = _executor.submit(_ranked, "vetorial", dense_search, collection, query, candidates, query_embedding)
+    lexical = _executor.submit(_ranked, "textual", search_passages, query, candidates)
+    dense, lexical = dense.result(), lexical.result()
+
+    # A page ranks where its best chunk ranks
+    dense_by_url = {}
+    for hit in dense:
+        dense_by_url.setdefault(hit['url'], hit)
+    lexical_by_url = {hit['url']: hit for hit in lexical}
+    fused = reciprocal_rank_fusion({"dense": list(dense_by_url), "fts": list(lexical_by_url)}, k, weights)
+
+    results = []
+    for url, score in fused[:n_results]:
+        hit = dense_by_url.get(url) or _best_chunk(collection, url, query)
+        if hit is None:
+            hit = {'id': None, 'url': url, 'text': lexical_by_url[url]['text']}
+        results.append({**hit, 'score': score})
+    logger.info(
+        f"Busca híbrida: {len(dense)} chunks vetoriais, {len(lexical)} páginas textuais, {len(results)} selecionados"
+    )
+    return results
@@ -0,0 +1,185 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Path to the SQLite file shared by the coordinator and its workers
+FRONTIER_PATH = Path("data/frontier.db")
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SharedFrontier:
+    """
+    Crawl frontier, visited set and result queue shared through a SQLite file
+    in WAL mode, so any number of worker processes can crawl together.
+
+    Workers lease batches of URLs for `lease_seconds`; a lease that expires
+    before its results are reported (e.g. the worker crashed) is handed to
+    the next worker asking for work. Every URL ever queued stays in the
+    frontier table, which doubles as the visited set. WAL mode relies on
+    shared memory, so every process must run on the host holding the file:
+    on a network filesystem it corrupts or deadlocks.
+    """
+
+    def __init__(self, db_path=FRONTIER_PATH, lease_seconds=60):
+        self.db_path = Path(db_path)
+        self.lease_seconds = lease_seconds
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode: every write transaction is opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS crawl_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY,
+                depth INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                not_before REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state, depth);
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record TEXT NOT NULL
+            );
+        """)
+
+    def _write(self, statements):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = statements(self.conn)
+            self.conn.execute("COMMIT")
+            return result
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def seed(self, seeds, max_depth, allowed_domains=None, content_mode="full", reset=True):
+        """
+        Start a crawl: store its configuration for the workers and queue the seeds.
+        """
+        config = {
+            "seeds": list(seeds),
+            "max_depth": max_depth,
+            "allowed_domains": sorted(allowed_domains) if allowed_domains else None,
+            "content_mode": content_mode,
+        }
+
+        def statements(conn):
+            if reset:
+                conn.execute("DELETE FROM frontier")
+                conn.execute("DELETE FROM results")
+            conn.executemany(
+                "INSERT OR REPLACE INTO crawl_meta (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in config.items()],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO frontier (url, depth) VALUES (?, 0)", [(seed,) for seed in seeds]
+            )
+
+        self._write(statements)
+
+    def config(self):
+        rows = self.conn.execute("SELECT key, value FROM crawl_meta").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def lease(self, worker_id, batch_size=10):
+        """
+        Lease up to `batch_size` (url, depth) pairs, shallowest first, taking
+        over expired leases.
+        """
+        now = time.time()
+
+        def statements(conn):
+            rows = conn.execute("""
+                SELECT url, depth FROM frontier
+                WHERE (state = 'pending' AND not_before <= ?) OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY depth LIMIT ?
+            """, (now, now, batch_size)).fetchall()
+            conn.executemany(
+                "UPDATE frontier SET state = 'leased', lease_owner = ?, lease_expires = ? WHERE url = ?",
+                [(worker_id, now + self.lease_seconds, url) for url, _ in rows],
+            )
+            return rows
+
+        return self._write(statements)
+
+    def report(self, worker_id, results):
+        """
+        Settle leased URLs. `results` holds (url, depth, record, discovered,
+        retry_at): the record is queued for the coordinator, the discovered
+        links are queued at depth + 1, and a `retry_at` timestamp puts the URL
+        back in the frontier instead.
+        """
+        def statements(conn):
+            for url, depth, record, discovered, retry_at in results:
+                if retry_at is not None:
+                    conn.execute("""
+                        UPDATE frontier SET state = 'pending', not_before = ?, attempts = attempts + 1,
+                            lease_owner = NULL, lease_expires = NULL
+                        WHERE url = ?
+                    """, (retry_at, url))
+                    continue
+                state = "failed" if record['status'] == "error" else "done"
+                conn.execute(
+                    "UPDATE frontier SET state = ?, error = ?, lease_owner = NULL, lease_expires = NULL WHERE url = ?",
+                    (state, record.get('error'), url),
+                )
+                # The final URL after redirects counts as visited too
+                conn.execute(
+                    "INSERT OR IGNORE INTO frontier (url, depth, state) VALUES (?, ?, 'done')", (record['url'], depth)
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO frontier (url, depth) VALUES (?, ?)",
+                    [(link, depth + 1) for link in discovered],
+                )
+                conn.execute("INSERT INTO results (record) VALUES (?)", (json.dumps(record),))
+
+        self._write(statements)
+        logger.info(f"[{worker_id}] Reported {len(results)} URLs")
+
+    def attempts(self, url):
+        row = self.conn.execute("SELECT attempts FROM frontier WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else 0
+
+    def take_results(self, limit=100):
+        """
+        Remove and return up to `limit` reported page records, oldest first.
+        """
+        def statements(conn):
+            rows = conn.execute("SELECT id, record FROM results ORDER BY id LIMIT ?", (limit,)).fetchall()
+            conn.executemany("DELETE FROM results WHERE id = ?", [(row_id,) for row_id, _ in rows])
+            return [json.loads(record) for _, record in rows]
+
+        return self._write(statements)
+
+    def finished(self):
+        """
+        Whether no URL is pending or leased anymore.
+        """
+        return self.conn.execute(
+            "SELECT 1 FROM frontier WHERE state IN ('pending', 'leased') LIMIT 1"
+        ).fetchone() is None
+
+    def progress(self):
+        rows = self.conn.execute("SELECT state, count(*) FROM frontier GROUP BY state").fetchall()
+        return dict(rows)
+
+    def close(self):
+        self.conn.close()
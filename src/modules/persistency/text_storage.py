@@ -1,11 +1,60 @@
+import hashlib
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 # Path to the SQLite database file
 DB_PATH = Path("data/crawler_memory.db")
 
+# Applied to every connection. WAL lets readers run while a crawl is writing,
+# and with WAL synchronous=NORMAL only risks the last commits on power loss.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",     # 64 MiB page cache
+    "PRAGMA mmap_size=268435456",   # 256 MiB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=30000",
+)
+
+_local = threading.local()
+_opened = []
+_opened_lock = threading.Lock()
+
+def open_connection(db_path=DB_PATH):
+    """
+    New connection with the storage pragmas applied.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 def get_connection(db_path=DB_PATH):
-    return sqlite3.connect(db_path)
+    """
+    Long-lived connection of the calling thread, opened on first use, so
+    every thread reads and writes without reconnecting.
+    """
+    connections = _local.__dict__.setdefault("connections", {})
+    key = str(Path(db_path).resolve())
+    if key not in connections:
+        connections[key] = open_connection(db_path)
+        with _opened_lock:
+            _opened.append(connections[key])
+    return connections[key]
+
+def close_connections():
+    """
+    Close the connections opened by get_connection in every thread.
+    """
+    with _opened_lock:
+        for conn in _opened:
+            conn.close()
+        _opened.clear()
+    _local.__dict__.pop("connections", None)
 
 def create_database_file(db_path=DB_PATH):
     db_path = Path(db_path)
@@ -16,71 +65,366 @@ def create_database_file(db_path=DB_PATH):
     else:
         print(f"DB file already exists at {db_path.resolve()}")
 
-def setup_database():
+def _migrate_legacy_tables(conn):
+    # Databases created before the pages table kept everything in a bare FTS table
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "webpages" in tables:
+        conn.execute("DROP TABLE IF EXISTS vocab")
+        rows = conn.execute("SELECT url, content FROM webpages").fetchall()
+        _upsert_pages(conn, rows)
+        conn.execute("DROP TABLE webpages")
+    if "fetch_errors" in tables:
+        conn.execute("""
+            INSERT INTO pages (url, content, status, error, http_status, fetched_at, size)
+            SELECT url, '', 'error', error, http_status, failed_at, 0 FROM fetch_errors WHERE true
+            ON CONFLICT (url) DO UPDATE SET status = 'error', error = excluded.error, http_status = excluded.http_status
+        """)
+        conn.execute("DROP TABLE fetch_errors")
+
+def setup_database(reset=False):
+    """
+    Create the pages table and its full-text index.
+
+    `pages` holds one row per URL with its fetch metadata; `pages_fts` is an
+    external-content FTS5 index over it (the URL is stored but not
+    tokenized), kept in sync by triggers.
+    """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("DROP TABLE IF EXISTS webpages")
-    cur.execute("""
-        CREATE VIRTUAL TABLE webpages USING fts5(
-            url,
-            content
-        );
-    """)
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conn:
+        if reset:
+            for table in ("vocab", "pages_fts", "pages", "webpages", "aliases", "fetch_errors"):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                content TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'ok',
+                error TEXT,
+                http_status INTEGER,
+                content_hash TEXT,
+                fetched_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+                url UNINDEXED,
+                content,
+                content='pages',
+                content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS pages_after_insert AFTER INSERT ON pages BEGIN
+                INSERT INTO pages_fts (rowid, url, content) VALUES (new.id, new.url, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS pages_after_delete AFTER DELETE ON pages BEGIN
+                INSERT INTO pages_fts (pages_fts, rowid, url, content) VALUES ('delete', old.id, old.url, old.content);
+            END;
+            -- Only reindex pages whose text changed
+            CREATE TRIGGER IF NOT EXISTS pages_after_update AFTER UPDATE OF content ON pages
+            WHEN old.content IS NOT new.content BEGIN
+                INSERT INTO pages_fts (pages_fts, rowid, url, content) VALUES ('delete', old.id, old.url, old.content);
+                INSERT INTO pages_fts (rowid, url, content) VALUES (new.id, new.url, new.content);
+            END;
+            CREATE TABLE IF NOT EXISTS aliases (
+                url TEXT PRIMARY KEY,
+                canonical_url TEXT NOT NULL
+            );
+        """)
+        _migrate_legacy_tables(conn)
+        # Created up front so that counting words never needs a write lock
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS vocab USING fts5vocab(pages_fts, 'row')")
 
 def save_page(url, content):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO webpages (url, content)
-        VALUES (?, ?)
-    """, (url, content))
-    conn.commit()
-    cur.close()
-    conn.close()
+    insert_pages([(url, content)])
 
 def wipe_database():
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM webpages;")
-    conn.commit()
-    cur.close()
-    conn.close()
+    with conn:
+        conn.execute("DELETE FROM pages;")
 
 def count_words(keyword=None):
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS vocab USING fts5vocab(webpages, 'row')")
-    
     if keyword:
-        cur.execute("SELECT sum(cnt) FROM vocab WHERE term = ?", (keyword.lower(),))
+        row = conn.execute("SELECT sum(cnt) FROM vocab WHERE term = ?", (keyword.lower(),)).fetchone()
     else:
-        cur.execute("SELECT sum(cnt) FROM vocab")
-    
-    total_words = cur.fetchone()[0] or 0
-    cur.close()
-    conn.close()
-    return total_words
-
-def save_many_pages(pages):
-    create_database_file()
-    setup_database()
+        row = conn.execute("SELECT sum(cnt) FROM vocab").fetchone()
+    return row[0] or 0
+
+def get_page(url):
+    """
+    Stored row of a URL as a dict, None when it was never stored.
+    """
+    conn = get_connection()
+    cur = conn.execute("""
+        SELECT url, content, status, error, http_status, content_hash, fetched_at, size
+        FROM pages WHERE url = ?
+    """, (url,))
+    row = cur.fetchone()
+    return dict(zip([column[0] for column in cur.description], row)) if row else None
+
+def search_pages(query, page=1, per_page=10, highlight=False):
+    """
+    Full-text search over the stored pages, best matches first.
+
+    `query` uses the FTS5 syntax: words, "exact phrases", prefix* terms,
+    AND / OR / NOT and NEAR(...). Results are ranked by bm25 and paginated;
+    each one holds the page URL, its score (lower is better), its status and
+    a snippet with the matches in [brackets]. With `highlight` the whole
+    highlighted text is included as well. Returns {'total', 'page',
+    'per_page', 'results'}; raises ValueError for a malformed query.
+    """
     conn = get_connection()
-    cur = conn.cursor()
-    cur.executemany("""
-        INSERT INTO webpages (url, content)
+    highlighted = "highlight(pages_fts, 1, '[', ']')" if highlight else "NULL"
+    try:
+        total = conn.execute("SELECT count(*) FROM pages_fts WHERE pages_fts MATCH ?", (query,)).fetchone()[0]
+        rows = conn.execute(f"""
+            SELECT pages.url, pages.status, rank, snippet(pages_fts, 1, '[', ']', '...', 24), {highlighted}
+            FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid
+            WHERE pages_fts MATCH ?
+            ORDER BY rank
+            LIMIT ? OFFSET ?
+        """, (query, per_page, (page - 1) * per_page)).fetchall()
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Invalid search query {query!r}: {e}") from e
+    results = []
+    for url, status, score, snippet, text in rows:
+        result = {'url': url, 'score': score, 'status': status, 'snippet': snippet}
+        if highlight:
+            result['highlight'] = text
+        results.append(result)
+    return {'total': total, 'page': page, 'per_page': per_page, 'results': results}
+
+def match_any(text):
+    """
+    FTS5 query matching pages with any word of free text, e.g. a question.
+    """
+    terms = dict.fromkeys(re.findall(r"\w+", text.lower()))
+    return " OR ".join(f'"{term}"' for term in terms)
+
+def search_passages(text, limit=20, tokens=64):
+    """
+    Best bm25 matches for free text as [{'url', 'text'}], where the text is
+    the passage of up to `tokens` tokens around the matches.
+    """
+    query = match_any(text)
+    if not query:
+        return []
+    rows = get_connection().execute("""
+        SELECT pages.url, snippet(pages_fts, 1, '', '', '...', ?)
+        FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid
+        WHERE pages_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (tokens, query, limit)).fetchall()
+    return [{'url': url, 'text': passage} for url, passage in rows]
+
+def _upsert_pages(conn, pages):
+    now = time.time()
+    conn.executemany("""
+        INSERT INTO pages (url, content, status, content_hash, fetched_at, size)
+        VALUES (?, ?, 'ok', ?, ?, ?)
+        ON CONFLICT (url) DO UPDATE SET
+            content = excluded.content,
+            status = 'ok',
+            error = NULL,
+            http_status = NULL,
+            content_hash = excluded.content_hash,
+            fetched_at = excluded.fetched_at,
+            size = excluded.size
+    """, [
+        (url, content, hashlib.sha256(content.encode("utf-8")).hexdigest(), now, len(content.encode("utf-8")))
+        for url, content in pages
+    ])
+
+def insert_pages(pages):
+    """
+    Insert (url, content) pages, replacing any stored version of the same URL.
+    """
+    conn = get_connection()
+    with conn:
+        _upsert_pages(conn, pages)
+
+def _delete_pages(conn, urls):
+    conn.executemany("""
+        DELETE FROM pages WHERE url = ?
+    """, [(url,) for url in urls])
+    conn.executemany("""
+        DELETE FROM aliases WHERE url = ? OR canonical_url = ?
+    """, [(url, url) for url in urls])
+
+def delete_pages(urls):
+    conn = get_connection()
+    with conn:
+        _delete_pages(conn, urls)
+
+def _save_aliases(conn, aliases):
+    conn.executemany("""
+        INSERT OR REPLACE INTO aliases (url, canonical_url)
         VALUES (?, ?)
-    """, pages)
-    conn.commit()
-    cur.close()
-    conn.close()
+    """, aliases)
 
-if __name__ == "__main__":
+def save_aliases(aliases):
+    conn = get_connection()
+    with conn:
+        _save_aliases(conn, aliases)
+
+def _save_fetch_errors(conn, records):
+    now = time.time()
+    conn.executemany("""
+        INSERT INTO pages (url, content, status, error, http_status, fetched_at, size)
+        VALUES (?, '', 'error', ?, ?, ?, 0)
+        ON CONFLICT (url) DO UPDATE SET
+            status = 'error',
+            error = excluded.error,
+            http_status = excluded.http_status,
+            fetched_at = excluded.fetched_at
+    """, [(record['url'], record['error'], record.get('http_status'), now) for record in records])
+
+def save_fetch_errors(records):
+    """
+    Mark pages whose fetch failed with their failure class and HTTP status,
+    keeping the text of their last successful fetch.
+    """
+    conn = get_connection()
+    with conn:
+        _save_fetch_errors(conn, records)
+
+
+class PageWriter:
+    """
+    Single buffered writer for ingestion. Pages, fetch errors, aliases,
+    deletions and any other write handed to defer() (e.g. the crawl state)
+    are kept in memory and applied in call order in one transaction every
+    `commit_every` buffered writes, or once the oldest waited
+    `commit_interval` seconds, on one connection, so ingestion never
+    competes with itself for the write lock and readers are never blocked
+    for longer than one commit.
+    """
+
+    def __init__(self, db_path=DB_PATH, commit_every=500, commit_interval=10.0):
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.written = 0
+        self._ops = []
+        self._oldest = None
+        self._pending = 0
+        self._pending_pages = 0
+        self._grouped = 0
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = open_connection(self.db_path)
+        return self._conn
+
+    def defer(self, function, *args, size=1):
+        """
+        Run function(conn, *args) in the transaction of the next commit.
+        `size` is how many writes it counts for towards `commit_every`.
+        """
+        with self._lock:
+            if not self._ops:
+                self._oldest = time.monotonic()
+            self._ops.append((function, args))
+            self._pending += size
+            self._flush_due()
+
+    def _flush_due(self):
+        if self._grouped or not self._ops:
+            return
+        if self._pending >= self.commit_every or time.monotonic() - self._oldest >= self.commit_interval:
+            self._flush()
+
+    @contextmanager
+    def group(self):
+        """
+        Keep the writes of the block together: they are committed in the same
+        transaction, e.g. pages and the crawl state marking them done.
+        """
+        with self._lock:
+            self._grouped += 1
+            try:
+                yield self
+            finally:
+                self._grouped -= 1
+                self._flush_due()
+
+    def write(self, pages):
+        pages = list(pages)
+        if pages:
+            with self._lock:
+                self._pending_pages += len(pages)
+                self.defer(_upsert_pages, pages, size=len(pages))
+
+    def write_errors(self, records):
+        """
+        Buffered save_fetch_errors.
+        """
+        records = list(records)
+        if records:
+            self.defer(_save_fetch_errors, records, size=len(records))
+
+    def write_aliases(self, aliases):
+        aliases = list(aliases)
+        if aliases:
+            self.defer(_save_aliases, aliases, size=len(aliases))
+
+    def delete(self, urls):
+        urls = list(urls)
+        if urls:
+            self.defer(_delete_pages, urls, size=len(urls))
+
+    @contextmanager
+    def transaction(self):
+        """
+        Commit what is buffered, then run the block in a transaction of its own.
+        """
+        with self._lock:
+            self._flush()
+            with self._connection() as conn:
+                yield conn
+
+    def _flush(self):
+        if not self._ops:
+            return
+        ops, pages = self._ops, self._pending_pages
+        # A failed transaction is rolled back and dropped, not replayed on every later flush
+        self._ops = []
+        self._pending = self._pending_pages = 0
+        with self._connection() as conn:
+            for function, args in ops:
+                function(conn, *args)
+        self.written += pages
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def save_many_pages(pages, commit_every=500):
     create_database_file()
     setup_database()
-    
+    with PageWriter(commit_every=commit_every) as writer:
+        writer.write(pages)
+
+if __name__ == "__main__":
+    create_database_file()
+    setup_database(reset=True)
+
     save_page(
         "https://example.com/about",
         "Lorem ipsum dolor sit amet, consectetur adipiscing elit. Curabitur gravida pellentesque orci. Cras lectus risus, ornare dictum lacus eget, efficitur commodo felis. Donec leo arcu, gravida ut augue ut, maximus tristique neque. Nulla semper cursus turpis, posuere maximus libero finibus in. Nullam pellentesque dui sit amet nibh pharetra ultrices. Cras congue, purus quis commodo finibus, nulla nisi suscipit ex, et tincidunt neque massa eu ipsum. Cras mattis ipsum sagittis leo laoreet accumsan."
@@ -1,31 +1,82 @@
+import hashlib
 import os
 import sys
+from pathlib import Path
 
 import chromadb
 import ollama #TODO Adicionar suporte a openai para rodar em nuvem
+from chromadb import EmbeddingFunction
+from chromadb.utils.embedding_functions import register_embedding_function
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 from logger import get_logger
 from modules.process_manager.master import compute_embeddings_parallel
+from .query_cache import collection_version
+from .retrieval import hybrid_search
 logger = get_logger(__name__)
 
 MODEL = "llama3.2"
 
+# Directory of the persistent ChromaDB index
+CHROMA_PATH = Path("data/chroma")
 
-class OllamaEmbeddingFunction:
-    def __init__(self, model_name="llama3.2"):
+
+@register_embedding_function
+class OllamaEmbeddingFunction(EmbeddingFunction):
+    """
+    Embeds texts with Ollama's batch endpoint, `batch_size` texts per request,
+    over a single client connection that is reused between calls. Texts found
+    in the optional EmbeddingCache are not sent to the model.
+
+    Chroma persists get_config() with the collection; the cache is not part
+    of it.
+    """
+
+    def __init__(self, model_name="llama3.2", host=None, batch_size=32, cache=None):
         self.model_name = model_name
+        self.host = host
+        self.batch_size = batch_size
+        self.cache = cache
+        self._client = None
+
+    @staticmethod
+    def name():
+        return "web_crawler_ollama"
+
+    def get_config(self):
+        return {"model_name": self.model_name, "host": self.host, "batch_size": self.batch_size}
+
+    @staticmethod
+    def build_from_config(config):
+        return OllamaEmbeddingFunction(**config)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_client"] = None
+        return state
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = ollama.Client(host=self.host)
+        return self._client
 
     def __call__(self, input: list[str]) -> list[list[float]]:
-        embeddings = []
-        logger.info(f"Iniciando geração de embeddings para batch de tamanho {len(input)}")
-        for idx, text in enumerate(input):
-            logger.debug(f"Gerando embedding para texto {idx + 1}/{len(input)}")
-            response = ollama.embeddings(model=self.model_name, prompt=text)
-            embeddings.append(response["embedding"])
+        cached = self.cache.get_many(self.model_name, input) if self.cache is not None else {}
+        missing = [i for i in range(len(input)) if i not in cached]
+        logger.info(f"Iniciando geração de embeddings para batch de tamanho {len(input)} ({len(cached)} em cache)")
+        computed = []
+        for start in range(0, len(missing), self.batch_size):
+            batch = [input[i] for i in missing[start:start + self.batch_size]]
+            logger.debug(f"Gerando embeddings para textos {start + 1}-{start + len(batch)}/{len(missing)}")
+            response = self.client.embed(model=self.model_name, input=batch)
+            computed.extend(response["embeddings"])
+        if self.cache is not None and computed:
+            self.cache.put_many(self.model_name, [input[i] for i in missing], computed)
+        cached.update(zip(missing, computed))
         logger.info("Finalizada geração de embeddings para batch")
-        return embeddings
+        return [cached[i] for i in range(len(input))]
 
 
 def get_prompt(query, context):
@@ -47,26 +98,39 @@ def get_ollama_response(query, context, model=MODEL):
     return response["response"]
 
 
-def initialize_chromadb():
+def initialize_chromadb(path=CHROMA_PATH):
     try:
-        logger.info("Inicializando cliente ChromaDB...")
-        client = chromadb.Client()
+        logger.info(f"Inicializando cliente ChromaDB persistente em {path}...")
+        client = chromadb.PersistentClient(path=str(path))
         logger.info("Cliente ChromaDB inicializado com sucesso")
         return client
     except Exception as e:
         logger.error(f"Erro ao inicializar o cliente ChromaDB: {e}")
+        raise
 
 
 def create_collection(client, collection_name, embedding_function):
     try:
-        logger.info(f"Criando coleção '{collection_name}'...")
-        collection = client.create_collection(
+        logger.info(f"Abrindo coleção '{collection_name}'...")
+        collection = client.get_or_create_collection(
             collection_name, embedding_function=embedding_function
         )
-        logger.info(f"Coleção '{collection_name}' criada com sucesso")
+        logger.info(f"Coleção '{collection_name}' pronta com {collection.count()} chunks")
         return collection
     except Exception as e:
         logger.error(f"Erro ao criar a coleção: {e}")
+        raise
+
+
+def _short_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(url, chunk):
+    """
+    Stable chunk ID: the same text on the same page always gets the same ID.
+    """
+    return f"{_short_hash(url)}_{_short_hash(chunk)}"
 
 
 def split_into_chunks(crawled_data, chunk_size=1000, chunk_overlap=200):
@@ -85,20 +149,70 @@ def split_into_chunks(crawled_data, chunk_size=1000, chunk_overlap=200):
     for i, entry in enumerate(crawled_data):
         logger.info(f"Processando documento {i + 1}/{len(crawled_data)}: {entry['url']}")
         chunks = text_splitter.split_text(entry["content"])
+        seen = set()
 
         for j, chunk in enumerate(chunks):
+            id_ = chunk_id(entry["url"], chunk)
+            if id_ in seen:
+                continue
+            seen.add(id_)
             all_chunks.append(chunk)
             all_metadatas.append({
                 "source": entry["url"],
-                "doc_id": i,
+                "doc_id": _short_hash(entry["url"]),
                 "chunk_index": j
             })
-            all_ids.append(f"doc_{i}_chunk_{j}")
+            all_ids.append(id_)
 
     logger.info(f"Divisão concluída. Total de chunks gerados: {len(all_chunks)}")
     return all_chunks, all_metadatas, all_ids
 
 
+def sync_chunks(collection, chunks, metadatas, ids):
+    """
+    Delete the stored chunks of these pages that are gone and return only
+    the chunks the collection does not have yet, which need embedding.
+    """
+    ids_by_source = {}
+    for meta, id_ in zip(metadatas, ids):
+        ids_by_source.setdefault(meta["source"], set()).add(id_)
+
+    existing = set()
+    for source, current_ids in ids_by_source.items():
+        stored_ids = set(collection.get(where={"source": source}, include=[])["ids"])
+        stale_ids = stored_ids - current_ids
+        if stale_ids:
+            collection.delete(ids=list(stale_ids))
+        existing |= stored_ids & current_ids
+
+    new = [(c, m, i) for c, m, i in zip(chunks, metadatas, ids) if i not in existing]
+    logger.info(f"Sincronização: {len(new)} chunks novos, {len(existing)} inalterados")
+    if not new:
+        return [], [], []
+    return tuple(list(column) for column in zip(*new))
+
+
+def missing_sources(collection, urls):
+    """
+    The URLs among `urls` that have no chunk in the collection.
+    """
+    urls = set(urls)
+    if not urls:
+        return set()
+    found = collection.get(where={"source": {"$in": list(urls)}}, include=["metadatas"])
+    return urls - {meta["source"] for meta in found["metadatas"]}
+
+
+def delete_sources(collection, urls):
+    """
+    Remove every chunk of pages that no longer exist.
+    """
+    urls = list(urls)
+    if urls:
+        collection.delete(where={"source": {"$in": urls}})
+        logger.info(f"Removidos chunks de {len(urls)} páginas")
+
+
 def batch_add(collection, documents, metadatas, ids, embeddings, batch_size=200):
     total = len(documents)
     logger.info(f"Iniciando adição em batch dos documentos na coleção, total={total}, batch_size={batch_size}")
@@ -112,7 +226,7 @@ def batch_add(collection, documents, metadatas, ids, embeddings, batch_size=200)
         batch_ids = ids[start_idx:end_idx]
         batch_embs = embeddings[start_idx:end_idx]
 
-        collection.add(
+        collection.upsert(
             documents=batch_docs,
             metadatas=batch_meta,
             ids=batch_ids,
@@ -126,7 +240,7 @@ def batch_add(collection, documents, metadatas, ids, embeddings, batch_size=200)
 def populate_collection(collection, crawled_data):
 
     
-    chunks, metadatas, ids = split_into_chunks(crawled_data)
+    chunks, metadatas, ids = sync_chunks(collection, *split_into_chunks(crawled_data))
     logger.info(f"Total de chunks: {len(chunks)}")
 
     embedding_function = OllamaEmbeddingFunction()
@@ -146,27 +260,52 @@ def get_mock_data():
     ]
 
 
-def process_query(collection, query_text, ammount=3):
-    results = collection.query(
-        query_texts=[query_text],
-        n_results=ammount,
-        include=["documents", "metadatas", "distances"],
-    )
+def process_query(collection, query_text, ammount=3, candidates=20, k=60, weights=None, cache=None):
+    """
+    Answer a question with the `ammount` chunks picked by hybrid_search
+    (BM25 and dense candidates fused by reciprocal rank) as context.
+
+    With a QueryCache, a repeated question reuses its retrieval and an
+    answer already generated from the same chunks (or, with semantic
+    caching, the answer to a similar question) is returned without calling
+    the model.
+    """
+    query_text = query_text.strip()
+    hits = embedding = None
+    if cache is not None:
+        cache.validate(collection_version(collection))
+        params = [ammount, candidates, k, weights]
+        hits = cache.get_retrieval(query_text, params)
+        if hits is None and cache.semantic:
+            embedding = cache.embed(query_text)
+            answer = cache.similar_answer(embedding)
+            if answer is not None:
+                return answer
+    if hits is None:
+        hits = hybrid_search(collection, query_text, ammount, candidates, k, weights, query_embedding=embedding)
+        if cache is not None and hits:
+            cache.put_retrieval(query_text, params, hits)
     print("-+-" * 20)
-    logger.info(f"Consulta: {results}")
-    if results and len(results["documents"]) > 0:
-        documents = results["documents"]
-        metadatas = results["metadatas"]
+    logger.info(f"Consulta: {[(hit['url'], round(hit['score'], 4)) for hit in hits]}")
+    if hits:
+        if cache is not None:
+            answer = cache.get_answer(query_text, MODEL, hits)
+            if answer is not None:
+                logger.info(f"Resposta em cache para a pergunta '{query_text}'")
+                return answer
 
         context = ""
-        for doc, meta in zip(documents[0], metadatas[0]):
-            url = meta.get("source", "URL desconhecida")
-            context += f"Fonte: {url}\nConteúdo: {doc}\n\n"
+        for hit in hits:
+            url = hit['url'] or "URL desconhecida"
+            context += f"Fonte: {url}\nConteúdo: {hit['text']}\n\n"
 
-        metadata = results["metadatas"]
         print("Sending", query_text, context)
         response = get_ollama_response(query_text, context)
         logger.info(f"Resposta para a pergunta '{query_text}': {response}")     
+        if cache is not None:
+            if cache.semantic and embedding is None:
+                embedding = cache.embed(query_text)
+            cache.put_answer(query_text, MODEL, hits, response, embedding)
         return response
     else:
         logger.warning(f"Nenhum resultado encontrado para a consulta: {query_text}")
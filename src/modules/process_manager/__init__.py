@@ -1,3 +1,29 @@
-from .master import start_scraping
+from .master import compute_embeddings_parallel, embed_batch, iter_scraping, start_scraping
+from .async_master import iter_scraping_async, start_scraping_async
+from .distributed import iter_scraping_distributed, run_worker
+from .pipeline import Stage, run_pipeline
+from .politeness import HostScheduler, RobotsCache
+from .frontier import KeywordScorer, UrlPatternScorer, WeightedScorer, breadth_first, inlink_count
+from .visited import BloomFilter, UrlFingerprintSet
 
-__all__ = ["start_scraping"]
\ No newline at end of file
+__all__ = [
+    "compute_embeddings_parallel",
+    "embed_batch",
+    "iter_scraping",
+    "iter_scraping_async",
+    "start_scraping",
+    "start_scraping_async",
+    "iter_scraping_distributed",
+    "run_worker",
+    "Stage",
+    "run_pipeline",
+    "HostScheduler",
+    "RobotsCache",
+    "KeywordScorer",
+    "UrlPatternScorer",
+    "WeightedScorer",
+    "breadth_first",
+    "inlink_count",
+    "BloomFilter",
+    "UrlFingerprintSet",
+]
\ No newline at end of file
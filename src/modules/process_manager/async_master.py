@@ -0,0 +1,127 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+from logger import get_logger
+from modules.data_processing import (
+    DEFAULT_BACKEND, canonicalize_url, classify_exception, error_record, fetch_html, parse_html,
+)
+from .master import discover_links, seed_list
+
+logger = get_logger(__name__)
+
+
+async def _crawl(
+    seeds, max_depth, concurrency, parse_processes, visited, canonicalizer, content_mode, parser_backend,
+    allowed_domains, emit,
+):
+    to_visit = asyncio.Queue()
+    for seed in seeds:
+        to_visit.put_nowait((seed, 0))
+    loop = asyncio.get_running_loop()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(verify=False, follow_redirects=True, limits=limits) as client:
+        with ProcessPoolExecutor(max_workers=parse_processes) as parser_pool:
+
+            async def fetch_worker():
+                while True:
+                    url, depth = await to_visit.get()
+                    try:
+                        if url in visited or depth > max_depth:
+                            continue
+                        visited.add(url)
+                        start = time.time()
+                        final_url, html, status, error = await fetch_html(client, url)
+                        url_result = canonicalizer(final_url) or final_url
+                        visited.add(url_result)
+                        if status == "error":
+                            await emit(error_record(url_result, error))
+                            continue
+                        if html is None:
+                            await emit({'url': url_result, 'text': "", 'links': [], 'status': status})
+                            continue
+                        record = await loop.run_in_executor(parser_pool, parse_html, final_url, html, content_mode, parser_backend)
+                        logger.info(f"[async] Scraped {url} in {time.time() - start:.2f}s, found {len(record['links'])} links.")
+                        if depth < max_depth:
+                            for link in discover_links(
+                                record['links'], final_url, seeds, visited, canonicalizer, allowed_domains,
+                            ):
+                                to_visit.put_nowait((link, depth + 1))
+                        record.update({'url': url_result, 'status': "ok"})
+                        await emit(record)
+                    except Exception as e:
+                        # Anything else, e.g. a broken parser pool, fails this page but not the worker
+                        logger.error(f"[async] Failed on {url}: {e!r}")
+                        await emit(error_record(url, classify_exception(e)))
+                    finally:
+                        to_visit.task_done()
+
+            workers = [asyncio.create_task(fetch_worker()) for _ in range(concurrency)]
+            await to_visit.join()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+def iter_scraping_async(
+    base_url, max_depth, concurrency=200, parse_processes=2, visited=None, canonicalizer=canonicalize_url,
+    content_mode="full", parser_backend=DEFAULT_BACKEND, buffer_size=100, allowed_domains=None,
+):
+    """
+    Scrape with a single asyncio event loop, yielding each page record as soon as it is fetched.
+
+    Up to `concurrency` requests are kept in flight by one httpx.AsyncClient,
+    while HTML parsing runs on a small process pool. The event loop runs in a
+    background thread and pauses once `buffer_size` records wait unconsumed.
+    `content_mode` and `parser_backend` are passed to parse_html. Seeds and
+    `allowed_domains` work as in iter_scraping; the frontier is a plain FIFO
+    queue.
+    """
+    visited = set() if visited is None else visited
+    seeds = [canonicalizer(seed) for seed in seed_list(base_url)]
+    logger.info(f"Starting async scraping: {', '.join(seeds)} up to depth {max_depth} with {concurrency} concurrent requests.")
+    start = time.time()
+    records = queue.Queue(maxsize=buffer_size)
+    done = object()
+    failure = []
+
+    async def emit(record):
+        await asyncio.get_running_loop().run_in_executor(None, records.put, record)
+
+    def run():
+        try:
+            asyncio.run(_crawl(
+                seeds, max_depth, concurrency, parse_processes, visited, canonicalizer, content_mode,
+                parser_backend, allowed_domains, emit,
+            ))
+        except Exception as e:
+            failure.append(e)
+        finally:
+            records.put(done)
+
+    threading.Thread(target=run, name="async-crawler", daemon=True).start()
+    scraped = 0
+    while True:
+        record = records.get()
+        if record is done:
+            break
+        scraped += 1
+        yield record
+    if failure:
+        raise failure[0]
+    logger.info(f"Scraping finished. {scraped} pages scraped. Time taken: {time.time() - start:.2f} seconds.")
+
+
+def start_scraping_async(*args, **kwargs):
+    """
+    Start web scraping with a single asyncio event loop and return every page record.
+
+    Takes the same arguments as iter_scraping_async and returns the same
+    {'url', 'text', 'links'} records as start_scraping.
+    """
+    return list(iter_scraping_async(*args, **kwargs))
@@ -0,0 +1,104 @@
+import time
+
+from logger import get_logger
+from modules.data_processing.urls import canonicalize_url
+from modules.data_processing.web_scrapping import TRANSIENT_ERRORS, extract_text_and_links, init_session
+from modules.persistency.shared_frontier import FRONTIER_PATH, SharedFrontier, default_worker_id
+from .master import MAX_RETRIES, discover_links, retry_delay, seed_list
+
+logger = get_logger(__name__)
+
+
+def run_worker(db_path=FRONTIER_PATH, worker_id=None, batch_size=10, poll_interval=1.0, lease_seconds=60):
+    """
+    Crawl as one worker of a distributed crawl until its frontier is exhausted.
+
+    The worker leases batches from the SharedFrontier at `db_path`, fetches
+    them with its own keep-alive session and reports records and discovered
+    links back. Start as many as needed on the coordinator's host (the
+    frontier file cannot be shared across machines); the crawl
+    configuration is read from the frontier, so start workers once the
+    coordinator has seeded it. Returns the number of URLs processed.
+    """
+    worker_id = worker_id or default_worker_id()
+    frontier = SharedFrontier(db_path, lease_seconds)
+    config = frontier.config()
+    while not config:
+        logger.info(f"[{worker_id}] Waiting for a crawl to be seeded in {db_path}")
+        time.sleep(poll_interval)
+        config = frontier.config()
+    seeds, max_depth = config["seeds"], config["max_depth"]
+    allowed_domains = config.get("allowed_domains")
+    init_session()
+    processed = 0
+    logger.info(f"[{worker_id}] Worker started on {db_path}")
+    try:
+        while True:
+            batch = frontier.lease(worker_id, batch_size)
+            if not batch:
+                if frontier.finished():
+                    break
+                time.sleep(poll_interval)
+                continue
+            results = []
+            for url, depth in batch:
+                record = extract_text_and_links(url, content_mode=config.get("content_mode", "full"))
+                if record['status'] == "error" and record['error'] in TRANSIENT_ERRORS:
+                    attempts = frontier.attempts(url) + 1
+                    if attempts <= MAX_RETRIES:
+                        retry_at = time.time() + retry_delay(attempts, record.get('retry_after'))
+                        results.append((url, depth, None, [], retry_at))
+                        continue
+                final_url = record['url']
+                record['url'] = canonicalize_url(final_url) or final_url
+                discovered = []
+                if depth < max_depth:
+                    discovered = discover_links(record['links'], final_url, seeds, set(), canonicalize_url, allowed_domains)
+                results.append((url, depth, record, discovered, None))
+            frontier.report(worker_id, results)
+            processed += len(batch)
+    finally:
+        frontier.close()
+    logger.info(f"[{worker_id}] Worker finished after {processed} URLs")
+    return processed
+
+
+def _drain(frontier, poll_interval, start):
+    scraped = 0
+    try:
+        while True:
+            # Reports settle URLs and queue their records atomically, so once
+            # the frontier is finished every record is already waiting
+            finished = frontier.finished()
+            records = frontier.take_results()
+            for record in records:
+                scraped += 1
+                yield record
+            if not records:
+                if finished:
+                    break
+                time.sleep(poll_interval)
+    finally:
+        progress = frontier.progress()
+        frontier.close()
+    logger.info(f"Scraping finished. {scraped} pages scraped, frontier: {progress}. Time taken: {time.time() - start:.2f} seconds.")
+
+
+def iter_scraping_distributed(
+    base_url, max_depth, db_path=FRONTIER_PATH, allowed_domains=None, content_mode="full", poll_interval=1.0,
+):
+    """
+    Coordinate a distributed crawl, returning an iterator over the page records reported by the workers.
+
+    Seeds the SharedFrontier at `db_path` right away (resetting any previous
+    crawl in it), so workers may be started as soon as this returns. The
+    iterator drains the records the workers report until no URL is pending
+    or leased; the crawl only progresses while workers (run_worker,
+    crawl_worker.py) run against the same file. A page whose worker lost
+    its lease may be reported twice.
+    """
+    seeds = [canonicalize_url(seed) for seed in seed_list(base_url)]
+    frontier = SharedFrontier(db_path)
+    frontier.seed(seeds, max_depth, allowed_domains, content_mode)
+    logger.info(f"Distributed crawl of {', '.join(seeds)} up to depth {max_depth} queued in {db_path}.")
+    return _drain(frontier, poll_interval, time.time())
@@ -0,0 +1,73 @@
+import re
+
+# A scorer is called as scorer(url, depth, inlinks, parent) and returns a
+# number; URLs with higher scores are fetched first. `inlinks` counts the
+# links to the URL seen so far and `parent` is the record of the page the
+# link was found on (None for seeds and retries).
+
+
+def breadth_first(url, depth, inlinks, parent):
+    """
+    Shallower pages first, in discovery order within a depth: plain BFS.
+    """
+    return -depth
+
+
+def inlink_count(url, depth, inlinks, parent):
+    """
+    Pages linked from more of the crawled pages first.
+    """
+    return inlinks
+
+
+class UrlPatternScorer:
+    """
+    Sum of the weights of the regular expressions the URL matches, e.g.
+    {r"/docs/": 5, r"/tag/|/page/\\d+": -3}.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [(re.compile(pattern), weight) for pattern, weight in patterns.items()]
+
+    def __call__(self, url, depth, inlinks, parent):
+        return sum(weight for pattern, weight in self.patterns if pattern.search(url))
+
+
+class KeywordScorer:
+    """
+    Relevance to a set of keywords: one point per keyword in the URL plus the
+    fraction of keywords found in the text of the linking page.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = [keyword.lower() for keyword in keywords]
+        self._parent = None
+        self._parent_score = 0.0
+
+    def _text_score(self, parent):
+        # Every link of a page is scored in a row, so its text is lowered once
+        if parent is not self._parent:
+            text = parent['text'].lower()
+            self._parent = parent
+            self._parent_score = sum(keyword in text for keyword in self.keywords) / len(self.keywords)
+        return self._parent_score
+
+    def __call__(self, url, depth, inlinks, parent):
+        if not self.keywords:
+            return 0.0
+        score = sum(keyword in url.lower() for keyword in self.keywords)
+        if parent is not None:
+            score += self._text_score(parent)
+        return score
+
+
+class WeightedScorer:
+    """
+    Weighted sum of several scorers, given as (scorer, weight) pairs.
+    """
+
+    def __init__(self, *weighted):
+        self.weighted = weighted
+
+    def __call__(self, url, depth, inlinks, parent):
+        return sum(weight * scorer(url, depth, inlinks, parent) for scorer, weight in self.weighted)
@@ -1,83 +1,316 @@
-import multiprocessing
-from multiprocessing import Manager, Pool
+import queue
+import random
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
 import time
+from .politeness import HostScheduler, RobotsCache
 from .worker import worker
 
 from logger import get_logger
+from modules.data_processing.sitemaps import iter_sitemap_urls, sitemap_locations
+from modules.data_processing.urls import canonicalize_url, has_binary_extension, in_domains, is_within
+from modules.data_processing.web_scrapping import TRANSIENT_ERRORS, error_record
 
 logger = get_logger(__name__)
 
+# Times a URL failing with a transient error is put back in the frontier
+MAX_RETRIES = 3
 
-def normalize_link(link, base_url):
-    return base_url + link if link.startswith('/') else link
+# Base delay in seconds of the jittered exponential backoff between attempts
+RETRY_BACKOFF = 1.0
+
+
+def normalize_link(link, page_url, canonicalizer=canonicalize_url):
+    """
+    Resolve a link against the final URL of the page it was found on.
+    """
+    return canonicalizer(link, page_url)
+
+
+def seed_list(base_url):
+    return [base_url] if isinstance(base_url, str) else list(base_url)
+
+
+def in_scope(url, base_url, allowed_domains=None):
+    """
+    Whether a URL may be crawled: on one of `allowed_domains` when given,
+    otherwise inside `base_url` (one seed URL or a list of them).
+    """
+    if allowed_domains:
+        return in_domains(url, allowed_domains)
+    return any(is_within(url, seed) for seed in seed_list(base_url))
+
+
+def discover_links(links, page_url, base_url, visited, canonicalizer=canonicalize_url, allowed_domains=None):
+    """
+    Canonical URLs of the links of a page that belong in the frontier: in
+    scope (see in_scope), not visited yet and not pointing at a binary file.
+    """
+    discovered = []
+    for link in links:
+        full_link = normalize_link(link, page_url, canonicalizer)
+        if (
+            full_link
+            and in_scope(full_link, base_url, allowed_domains)
+            and not has_binary_extension(full_link)
+            and full_link not in visited
+        ):
+            discovered.append(full_link)
+    return discovered
+
+
+def sitemap_seeds(seeds, robots=None, canonicalizer=canonicalize_url, allowed_domains=None):
+    """
+    Yield (url, lastmod) for the in-scope pages listed in the sitemaps of the
+    seeds, found in their robots.txt or at /sitemap.xml.
+    """
+    robots = RobotsCache() if robots is None else robots
+    locations = [location for seed in seeds for location in sitemap_locations(seed, robots.site_maps(seed))]
+    for loc, lastmod in iter_sitemap_urls(dict.fromkeys(locations)):
+        url = canonicalizer(loc)
+        if url and in_scope(url, seeds, allowed_domains) and not has_binary_extension(url):
+            yield url, lastmod
 
 
 def worker_wrapper(args):
-    url, base_url, function = args
-    return worker((url, base_url), function)
+    url, base_url, function, validators = args
+    return worker((url, base_url, validators), function)
 
 
-def _compute_batch_embeddings(args):
-    embedding_function, batch_docs = args
-    logger.info(f"Processando batch com {len(batch_docs)} documentos em processo {multiprocessing.current_process().name}")
-    embs = embedding_function(batch_docs)
-    logger.info(f"Finalizado batch em processo {multiprocessing.current_process().name}")
-    return embs
+def _report_failure(completed, url, depth, error):
+    logger.error(f"Worker failed on {url}: {error}")
+    completed.put((url, depth, error_record(url, "worker")))
 
 
-def compute_embeddings_parallel(embedding_function, documents, batch_size=50, processes=None):
+def retry_delay(attempt, retry_after=None, backoff=RETRY_BACKOFF):
+    """
+    Seconds before retrying a URL for the `attempt`-th time: jittered
+    exponential backoff, never shorter than the server's Retry-After.
+    """
+    return max(retry_after or 0, backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+
+def embed_batch(embedding_function, batch_docs, retries=3, backoff=0.5):
+    """
+    Embed one batch, retrying failed calls with jittered exponential backoff.
+    """
+    for attempt in range(retries + 1):
+        try:
+            logger.info(f"Processando batch com {len(batch_docs)} documentos em {threading.current_thread().name}")
+            return embedding_function(batch_docs)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.warning(f"Falha ao gerar embeddings ({e}), nova tentativa em {delay:.2f}s")
+            time.sleep(delay)
+
+
+def compute_embeddings_parallel(
+    embedding_function, documents, batch_size=50, max_in_flight=4, retries=3, backoff=0.5,
+):
+    """
+    Embed `documents` with at most `max_in_flight` concurrent requests to the
+    model server, returning the embeddings in document order.
+    """
     total = len(documents)
-    logger.info(f"Iniciando computação paralela de embeddings para {total} documentos, batch_size={batch_size}")
+    logger.info(
+        f"Iniciando computação paralela de embeddings para {total} documentos, "
+        f"batch_size={batch_size}, max_in_flight={max_in_flight}"
+    )
     batches = [
         documents[i : i + batch_size] for i in range(0, total, batch_size)
     ]
 
     logger.info(f"Total de batches para processar: {len(batches)}")
-    args = [(embedding_function, batch) for batch in batches]
-    with multiprocessing.Pool(processes=processes) as pool:
-        results = pool.map(_compute_batch_embeddings, args)
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embeddings") as executor:
+        embed = partial(embed_batch, embedding_function, retries=retries, backoff=backoff)
+        results = list(executor.map(embed, batches))
     embeddings = [emb for batch_embs in results for emb in batch_embs]
 
-    logger.info("Finalizada computação paralela de embeddings para todos os documentos")
+    elapsed = time.time() - start
+    rate = total / elapsed if elapsed > 0 else 0
+    logger.info(
+        f"Finalizada computação paralela de embeddings: {total} chunks em {elapsed:.2f}s ({rate:.1f} chunks/s)"
+    )
     return embeddings
 
 
-def start_scraping(base_url, max_depth, function, processes=12):
+def iter_scraping(
+    base_url, max_depth, function, processes=12, initializer=None, initargs=(), visited=None,
+    canonicalizer=canonicalize_url, state=None, scheduler=None, allowed_domains=None, max_pages=None,
+    use_sitemaps=False,
+):
     """
-    Start web scraping with multiprocessing
+    Scrape with multiprocessing, yielding each page record as soon as it is fetched.
+
+    URLs are handed to the pool as soon as a worker is free and the links of
+    each page are queued as soon as it finishes, so a slow page never holds
+    back the rest of its depth level. `initializer` runs once in every worker,
+    e.g. to open the HTTP session the worker reuses for all of its URLs.
+
+    `base_url` is one seed URL or a list of them. Links are followed inside
+    the seeds, or anywhere on `allowed_domains` (hostnames, subdomains
+    included) when given. With `max_pages` the crawl stops after that many
+    URLs were fetched. With `use_sitemaps` the pages listed in the seeds'
+    sitemaps are queued as seeds too, so deep pages do not wait for link
+    discovery.
+
+    The frontier and visited set only live in this process. Pass a compact
+    `visited` set (UrlFingerprintSet, BloomFilter) for large crawls. Every
+    URL goes through `canonicalizer` before the visited check.
+
+    `scheduler` (HostScheduler) holds the frontier, orders it with its
+    scorer and enforces per-host politeness; the default one is a plain
+    breadth-first queue without limits. Pages failing with a transient
+    error (TRANSIENT_ERRORS) go back into the frontier with a backoff
+    delay, up to MAX_RETRIES times, and a Retry-After makes their whole host
+    wait. Only the final outcome of a URL is yielded; failed pages have
+    status 'error' and their failure class in 'error'.
+
+    With a persistent `state` (CrawlState) an interrupted crawl resumes from
+    its saved frontier, and pages fetched before are requested conditionally;
+    the fetch function then receives the stored validators as a second
+    argument. A crawl cut short by `max_pages` is left unfinished, so the
+    next run carries on from its frontier. A page whose sitemap <lastmod> is
+    older than its last fetch is not requested at all and is reported as
+    'not_modified'.
     """
-    manager = Manager()
-    visited = manager.dict()
-    results = manager.list()
-    to_visit = manager.list([(base_url, 0)])
-    logger.info(f"Starting scraping: {base_url} up to depth {max_depth} with {processes} processes.")
+    visited = set() if visited is None else visited
+    scheduler = HostScheduler() if scheduler is None else scheduler
+    seeds = [canonicalizer(seed) for seed in seed_list(base_url)]
+    if state is not None:
+        for url, depth in state.start(seeds):
+            scheduler.add(url, depth)
+        for url in state.visited_urls():
+            visited.add(url)
+    else:
+        for seed in seeds:
+            scheduler.add(seed, 0)
+    lastmods = {}
+    if use_sitemaps:
+        listed = []
+        for url, lastmod in sitemap_seeds(seeds, scheduler.robots, canonicalizer, allowed_domains):
+            if scheduler.add(url, 0):
+                listed.append((url, 0))
+                if lastmod is not None:
+                    lastmods[url] = lastmod
+        if state is not None:
+            state.push_many(listed)
+        logger.info(f"{len(listed)} URLs queued from sitemaps.")
+    completed = queue.Queue()
+    retries = {}
+    failures = Counter()
+    retried = 0
+    in_flight = 0
+    max_in_flight = processes * 2
+    submitted = 0
+    scraped = 0
+    logger.info(f"Starting scraping: {', '.join(seeds)} up to depth {max_depth} with {processes} processes.")
     start = time.time()
 
-    with Pool(processes=processes) as pool:
-        while to_visit:
-            current_batch = []
-            next_round = []
-            for url, depth in list(to_visit):
-                if url in visited or depth > max_depth:
+    def settle(requested_url, depth, record):
+        final_url = record['url']
+        record['url'] = canonicalizer(final_url) or final_url
+        visited.add(record['url'])
+        if state is not None:
+            record = state.complete(requested_url, record)
+        if depth < max_depth:
+            discovered = [
+                (link, depth + 1)
+                for link in discover_links(
+                    record['links'], final_url, seeds, visited, canonicalizer, allowed_domains,
+                )
+                if scheduler.add(link, depth + 1, parent=record)
+            ]
+            if state is not None:
+                state.push_many(discovered)
+        return record
+
+    with Pool(processes=processes, initializer=initializer, initargs=initargs) as pool:
+        while len(scheduler) or in_flight:
+            budget_left = max_pages is None or submitted < max_pages
+            while in_flight < max_in_flight and budget_left:
+                item = scheduler.pop_ready()
+                if item is None:
+                    break
+                url, depth = item
+                if (url in visited and url not in retries) or depth > max_depth:
+                    continue
+                if state is not None and url in lastmods and state.fetched_since(url, lastmods[url]):
+                    visited.add(url)
+                    scraped += 1
+                    yield settle(url, depth, {'url': url, 'text': "", 'links': [], 'status': "not_modified"})
                     continue
-                visited[url] = True
-                current_batch.append((url, base_url, depth))
+                if url not in retries:
+                    submitted += 1
+                    budget_left = max_pages is None or submitted < max_pages
+                visited.add(url)
+                scheduler.started(url)
                 logger.info(f"Visiting: {url} at depth {depth}")
-            to_visit[:] = []
-
-            if not current_batch:
-                logger.info("No more URLs to process. Exiting loop.")
-                break
-            current_batch_with_func = [(url, base_url, function) for url, base_url, depth in current_batch]
-            output = pool.map(worker_wrapper, current_batch_with_func)
-
-            for (url, depth), (url_result, text, links) in zip([(u, d) for u, _, d in current_batch], output):
-                results.append({'url': url_result, 'text': text, 'links': links})
-                for link in links:
-                    full_link = normalize_link(link, base_url)
-                    if full_link.startswith(base_url) and full_link not in visited:
-                        next_round.append((full_link, depth + 1))
-            to_visit.extend(next_round)
-
-    logger.info(f"Scraping finished. {len(results)} pages scraped. Time taken: {time.time() - start:.2f} seconds.")
-    return list(results)
\ No newline at end of file
+                validators = state.validators(url) if state is not None else None
+                pool.apply_async(
+                    worker_wrapper,
+                    ((url, seeds, function, validators),),
+                    callback=lambda record, url=url, depth=depth: completed.put((url, depth, record)),
+                    error_callback=partial(_report_failure, completed, url, depth),
+                )
+                in_flight += 1
+
+            if not in_flight:
+                wait = scheduler.seconds_until_ready()
+                if wait is None:
+                    logger.info("No more URLs to process. Exiting loop.")
+                    break
+                if not budget_left:
+                    logger.info(f"Page budget of {max_pages} reached. Exiting loop.")
+                    break
+                time.sleep(wait)
+                continue
+
+            # Wake up when a held back URL or a rate limited host is due, unless
+            # nothing more can be submitted before a page completes
+            can_submit = in_flight < max_in_flight and budget_left
+            try:
+                requested_url, depth, record = completed.get(
+                    timeout=scheduler.seconds_until_ready() if can_submit else None,
+                )
+            except queue.Empty:
+                continue
+            in_flight -= 1
+            scheduler.finished(requested_url, record.get('retry_after'))
+            if record['status'] == "error":
+                attempts = retries.get(requested_url, 0) + 1
+                if record['error'] in TRANSIENT_ERRORS and attempts <= MAX_RETRIES:
+                    retries[requested_url] = attempts
+                    delay = retry_delay(attempts, record.get('retry_after'))
+                    logger.warning(
+                        f"Retrying {requested_url} ({record['error']}) in {delay:.1f}s, "
+                        f"attempt {attempts}/{MAX_RETRIES}"
+                    )
+                    scheduler.add(requested_url, depth, not_before=time.monotonic() + delay)
+                    retried += 1
+                    continue
+                failures[record['error']] += 1
+            retries.pop(requested_url, None)
+            scraped += 1
+            yield settle(requested_url, depth, record)
+
+    if state is not None and not len(scheduler):
+        state.finish()
+    logger.info(f"Scraping finished. {scraped} pages scraped. Time taken: {time.time() - start:.2f} seconds.")
+    if failures or retried:
+        logger.warning(f"Fetch failures by class: {dict(failures)}, {retried} retries.")
+
+
+def start_scraping(*args, **kwargs):
+    """
+    Start web scraping with multiprocessing and return every page record.
+
+    Takes the same arguments as iter_scraping.
+    """
+    return list(iter_scraping(*args, **kwargs))
@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+_END = object()
+
+
+class Stage:
+    """
+    One step of a streaming pipeline.
+
+    `function` receives a list of up to `batch_size` items and returns the
+    items to hand to the next stage. A partial batch is flushed after
+    `flush_interval` seconds without new input.
+    """
+
+    def __init__(self, name, function, batch_size=1, workers=1, flush_interval=1.0):
+        self.name = name
+        self.function = function
+        self.batch_size = batch_size
+        self.workers = workers
+        self.flush_interval = flush_interval
+
+
+def _run_stage(stage, inbox, outbox, state):
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        items = list(batch)
+        batch.clear()
+        if state["error"] is not None:
+            return
+        try:
+            output = stage.function(items) or ()
+            with state["lock"]:
+                state["counts"][stage.name] += len(items)
+            if outbox is not None:
+                for item in output:
+                    outbox.put(item)
+        except Exception as e:
+            logger.error(f"Pipeline stage '{stage.name}' failed: {e}")
+            state["error"] = e
+
+    while True:
+        try:
+            item = inbox.get(timeout=stage.flush_interval)
+        except queue.Empty:
+            flush()
+            continue
+        if item is _END:
+            flush()
+            inbox.put(_END)
+            with state["lock"]:
+                state["finished"][stage.name] += 1
+                last = state["finished"][stage.name] == stage.workers
+            if last and outbox is not None:
+                outbox.put(_END)
+            return
+        batch.append(item)
+        if len(batch) >= stage.batch_size:
+            flush()
+
+
+def run_pipeline(source, stages, queue_size=100):
+    """
+    Stream the items of `source` through `stages`.
+
+    Every stage runs in its own threads and stages are connected by bounded
+    queues, so a slow stage blocks the ones before it instead of letting
+    items pile up in memory. Returns the number of items each stage handled.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    state = {
+        "lock": threading.Lock(),
+        "error": None,
+        "counts": {stage.name: 0 for stage in stages},
+        "finished": {stage.name: 0 for stage in stages},
+    }
+    threads = []
+    for index, stage in enumerate(stages):
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        for worker_index in range(stage.workers):
+            thread = threading.Thread(
+                target=_run_stage,
+                args=(stage, queues[index], outbox, state),
+                name=f"{stage.name}-{worker_index}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+    start = time.time()
+    try:
+        for item in source:
+            if state["error"] is not None:
+                break
+            queues[0].put(item)
+    finally:
+        queues[0].put(_END)
+        for thread in threads:
+            thread.join()
+
+    if state["error"] is not None:
+        raise state["error"]
+    logger.info(f"Pipeline finished in {time.time() - start:.2f}s: {state['counts']}")
+    return state["counts"]
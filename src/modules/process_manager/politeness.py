@@ -0,0 +1,245 @@
+import heapq
+import itertools
+import math
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+from logger import get_logger
+from .frontier import breadth_first
+
+logger = get_logger(__name__)
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+
+def parse_crawl_delays(lines):
+    """
+    Crawl-delay of each user agent named in a robots.txt, in seconds.
+
+    urllib.robotparser only reads integer values and silently ignores e.g.
+    "Crawl-delay: 0.5", so the delays are parsed here as floats.
+    """
+    delays = {}
+    agents, in_rules = [], False
+    for line in lines:
+        field, _, value = line.split("#", 1)[0].partition(":")
+        field, value = field.strip().lower(), value.strip()
+        if field == "user-agent":
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+        elif field in ("allow", "disallow", "crawl-delay", "request-rate"):
+            in_rules = True
+            if field != "crawl-delay":
+                continue
+            try:
+                delay = float(value)
+            except ValueError:
+                continue
+            if math.isfinite(delay) and delay >= 0:
+                for agent in agents:
+                    delays.setdefault(agent, delay)
+    return delays
+
+
+class RobotsCache:
+    """
+    Fetches, parses and caches robots.txt once per host.
+
+    Hosts whose robots.txt cannot be read are treated as allowing everything.
+    """
+
+    def __init__(self, user_agent="*", timeout=5):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self._parsers = {}
+        self._delays = {}
+
+    @staticmethod
+    def _origin(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _parser(self, url):
+        key = self._origin(url)
+        if key not in self._parsers:
+            parser = RobotFileParser(f"{key}/robots.txt")
+            self._delays[key] = {}
+            try:
+                response = requests.get(f"{key}/robots.txt", timeout=self.timeout, verify=False)
+                if response.status_code in (401, 403):
+                    parser.disallow_all = True
+                elif response.ok:
+                    lines = response.text.splitlines()
+                    parser.parse(lines)
+                    self._delays[key] = parse_crawl_delays(lines)
+                else:
+                    parser.allow_all = True
+            except Exception as e:
+                logger.warning(f"Could not read robots.txt of {key}: {e}")
+                parser.allow_all = True
+            self._parsers[key] = parser
+        return self._parsers[key]
+
+    def can_fetch(self, url):
+        return self._parser(url).can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, url):
+        self._parser(url)
+        delays = self._delays[self._origin(url)]
+        # Same matching as urllib.robotparser: the first group naming our
+        # agent, otherwise the "*" one
+        agent = self.user_agent.split("/")[0].lower()
+        for name, delay in delays.items():
+            if name != "*" and name in agent:
+                return delay
+        return delays.get("*")
+
+    def site_maps(self, url):
+        return self._parser(url).site_maps() or []
+
+
+class _Host:
+    def __init__(self, delay):
+        # heap of (-score, sequence, url, depth)
+        self.pending = []
+        self.in_flight = 0
+        self.delay = delay
+        self.next_allowed = 0.0
+
+
+class HostScheduler:
+    """
+    Best-first crawl frontier that hands out URLs host by host.
+
+    URLs are ranked by `scorer` (see frontier.py); the default one keeps
+    plain breadth-first order. A URL seen again with a higher score, e.g. a
+    new inlink, moves up in the queue.
+
+    Each host gets at most `max_per_host` requests in flight and one request
+    start every 1 / `requests_per_second` seconds, or every robots.txt
+    Crawl-delay when that is longer. A host told to back off (Retry-After)
+    is paused while the other hosts keep being served. URLs added with a
+    `not_before` time are held back until then, so a retry never occupies a
+    worker while it waits.
+    """
+
+    def __init__(self, requests_per_second=None, max_per_host=None, robots=None, scorer=breadth_first):
+        self.min_interval = 1 / requests_per_second if requests_per_second else 0.0
+        self.max_per_host = max_per_host
+        self.robots = robots
+        self.scorer = scorer
+        self._hosts = {}
+        self._delayed = []
+        self._sequence = itertools.count()
+        # url -> (score, sequence) of its live heap entry
+        self._queued = {}
+        self._inlinks = Counter()
+
+    def __len__(self):
+        return len(self._queued) + len(self._delayed)
+
+    def _host(self, url):
+        name = host_of(url)
+        if name not in self._hosts:
+            delay = self.min_interval
+            if self.robots is not None:
+                delay = max(delay, self.robots.crawl_delay(url) or 0)
+            self._hosts[name] = _Host(delay)
+        return self._hosts[name]
+
+    def _push(self, url, depth, score):
+        queued = self._queued.get(url)
+        if queued is not None and queued[0] >= score:
+            return
+        sequence = next(self._sequence)
+        self._queued[url] = (score, sequence)
+        heapq.heappush(self._host(url).pending, (-score, sequence, url, depth))
+
+    def add(self, url, depth, parent=None, not_before=None):
+        """
+        Queue a URL found at `depth` on the `parent` page record. Returns
+        False when robots.txt disallows it.
+        """
+        if self.robots is not None and not self.robots.can_fetch(url):
+            logger.info(f"Disallowed by robots.txt: {url}")
+            return False
+        if not_before is not None:
+            heapq.heappush(self._delayed, (not_before, next(self._sequence), url, depth))
+            return True
+        if parent is not None:
+            self._inlinks[url] += 1
+        self._push(url, depth, self.scorer(url, depth, self._inlinks[url], parent))
+        return True
+
+    def _top(self, host):
+        # Drop entries superseded by a higher score for the same URL
+        while host.pending:
+            neg_score, sequence, url, _ = host.pending[0]
+            if self._queued.get(url) == (-neg_score, sequence):
+                return host.pending[0]
+            heapq.heappop(host.pending)
+        return None
+
+    def _available(self, host, now):
+        if now < host.next_allowed:
+            return False
+        return self.max_per_host is None or host.in_flight < self.max_per_host
+
+    def pop_ready(self, now=None):
+        """
+        Best scored (url, depth) among the hosts allowed to receive a request
+        now, or None when every host must wait.
+        """
+        now = time.monotonic() if now is None else now
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, url, depth = heapq.heappop(self._delayed)
+            self._push(url, depth, self.scorer(url, depth, self._inlinks[url], None))
+        best = None
+        for host in self._hosts.values():
+            if not self._available(host, now):
+                continue
+            top = self._top(host)
+            if top is not None and (best is None or top < best[0]):
+                best = (top, host)
+        if best is None:
+            return None
+        _, _, url, depth = heapq.heappop(best[1].pending)
+        del self._queued[url]
+        return url, depth
+
+    def started(self, url, now=None):
+        now = time.monotonic() if now is None else now
+        host = self._host(url)
+        host.in_flight += 1
+        host.next_allowed = max(host.next_allowed, now + host.delay)
+
+    def finished(self, url, retry_after=None, now=None):
+        now = time.monotonic() if now is None else now
+        host = self._host(url)
+        host.in_flight = max(0, host.in_flight - 1)
+        if retry_after:
+            logger.warning(f"Backing off {host_of(url)} for {retry_after:.1f}s")
+            host.next_allowed = max(host.next_allowed, now + retry_after)
+
+    def seconds_until_ready(self, now=None):
+        """
+        How long until some host with pending URLs may be served or a held
+        back URL is due, ignoring hosts that are only waiting for in-flight
+        requests.
+        """
+        now = time.monotonic() if now is None else now
+        waits = [
+            max(0.0, host.next_allowed - now)
+            for host in self._hosts.values()
+            if self._top(host) is not None and (self.max_per_host is None or host.in_flight < self.max_per_host)
+        ]
+        if self._delayed:
+            waits.append(max(0.0, self._delayed[0][0] - now))
+        return min(waits) if waits else None
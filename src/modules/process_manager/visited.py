@@ -0,0 +1,61 @@
+import hashlib
+import math
+
+
+def url_fingerprint(url):
+    """
+    64-bit fingerprint of a URL.
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class UrlFingerprintSet:
+    """
+    Visited set storing 64-bit URL fingerprints instead of the URL strings.
+
+    Collisions are possible but negligible below billions of URLs.
+    """
+
+    def __init__(self):
+        self._fingerprints = set()
+
+    def add(self, url):
+        self._fingerprints.add(url_fingerprint(url))
+
+    def __contains__(self, url):
+        return url_fingerprint(url) in self._fingerprints
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+
+class BloomFilter:
+    """
+    Fixed-size visited set with a bounded false-positive rate.
+
+    A false positive means a URL is wrongly reported as visited and skipped,
+    never fetched twice.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+
+    def _positions(self, url):
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, url):
+        for position in self._positions(url):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+
+    def __contains__(self, url):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(url))
+
+    def __len__(self):
+        return self._count
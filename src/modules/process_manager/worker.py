@@ -1,7 +1,7 @@
 from multiprocessing import current_process
 
 def worker(args, function):
-    url, base = args
-    return function(url)
-
-
+    url, base, validators = args
+    if validators:
+        return function(url, validators)
+    return function(url)
\ No newline at end of file
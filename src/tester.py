@@ -11,7 +11,12 @@ from datetime import datetime
 sys.path.append(os.path.join(os.path.dirname(__file__), 'modules'))
 
 from logger import get_logger
-from modules.data_processing import extract_text_and_links
+from modules.data_processing import (
+    create_connection_stats,
+    extract_text_and_links,
+    init_session,
+    read_connection_stats,
+)
 from modules.process_manager import start_scraping
 from modules.persistency import (
     count_words,
@@ -42,12 +47,16 @@ class CrawlerTester:
         success = False
         pages_scraped = 0
         error_message = None
+        connection_stats = create_connection_stats()
         
         try:
-            pages_raw = start_scraping(self.base_url, depth, extract_text_and_links, processes)
+            pages_raw = start_scraping(
+                self.base_url, depth, extract_text_and_links, processes,
+                initializer=init_session, initargs=(connection_stats,),
+            )
             pages_scraped = len(pages_raw)
             
-            pages = [(page['url'], page['text']) for page in pages_raw]
+            pages = [(page['url'], page['text']) for page in pages_raw if page['status'] != "error"]
             save_many_pages(pages)
             
             success = True
@@ -59,6 +68,7 @@ class CrawlerTester:
         
         end_time = time.time()
         duration = end_time - start_time
+        connections = read_connection_stats(connection_stats)
         
         result = {
             'nome_teste': test_name,
@@ -70,7 +80,9 @@ class CrawlerTester:
             'duracao_minutos': round(duration / 60, 2),
             'mensagem_erro': error_message,
             'timestamp': datetime.now().isoformat(),
-            'paginas_por_segundo': round(pages_scraped / duration, 2) if duration > 0 else 0
+            'paginas_por_segundo': round(pages_scraped / duration, 2) if duration > 0 else 0,
+            'conexoes_novas': connections['new'],
+            'conexoes_reutilizadas': connections['reused'],
         }
         
         self.results.append(result)
@@ -97,6 +109,7 @@ class CrawlerTester:
                 
                 if result['sucesso']:
                     print(f"✅ SUCESSO: {result['paginas_coletadas']} páginas em {result['duracao_segundos']}s ({result['paginas_por_segundo']} páginas/s)")
+                    print(f"   Conexões: {result['conexoes_novas']} novas, {result['conexoes_reutilizadas']} reutilizadas")
                 else:
                     print(f"❌ FALHOU: {result['mensagem_erro']}")
                 
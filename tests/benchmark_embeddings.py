@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ollama_stub import start_stub
+from modules.persistency import OllamaEmbeddingFunction
+from modules.process_manager import compute_embeddings_parallel
+
+
+def run(name, embed, texts):
+    start = time.time()
+    embeddings = embed(texts)
+    elapsed = time.time() - start
+    print(f"{name}: {len(embeddings)} chunks in {elapsed:.2f}s ({len(embeddings) / elapsed:.1f} chunks/s)")
+
+
+if __name__ == "__main__":
+    server = start_stub()
+    host = f"http://127.0.0.1:{server.server_port}"
+    texts = [f"Chunk number {i} with some text to embed." for i in range(500)]
+
+    print("\n=== EMBEDDING BENCHMARK ===")
+    for batch_size in (1, 8, 32, 128):
+        run(f"batch_size={batch_size}", OllamaEmbeddingFunction(host=host, batch_size=batch_size), texts)
+    embedding_function = OllamaEmbeddingFunction(host=host, batch_size=32)
+    for max_in_flight in (1, 4, 8):
+        run(
+            f"batch_size=32 max_in_flight={max_in_flight}",
+            lambda texts: compute_embeddings_parallel(embedding_function, texts, batch_size=32, max_in_flight=max_in_flight),
+            texts,
+        )
+
+    server.shutdown()
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from synthetic_site import start_server
+from modules.data_processing import (
+    create_connection_stats,
+    extract_text_and_links,
+    init_session,
+    read_connection_stats,
+)
+from modules.process_manager import start_scraping, start_scraping_async
+
+
+def run(name, scrape):
+    start = time.time()
+    pages = scrape()
+    elapsed = time.time() - start
+    print(f"{name}: {len(pages)} pages in {elapsed:.2f}s ({len(pages) / elapsed:.2f} pages/s)")
+
+
+if __name__ == "__main__":
+    depth = 4
+    server = start_server(pages=800, fanout=5)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    print("\n=== ENGINE BENCHMARK ===")
+    for processes in (4, 12, 24):
+        connection_stats = create_connection_stats()
+        run(f"process x{processes}", lambda: start_scraping(
+            base_url, depth, extract_text_and_links, processes,
+            initializer=init_session, initargs=(connection_stats,),
+        ))
+        print(f"  connections: {read_connection_stats(connection_stats)}")
+    for concurrency in (50, 200):
+        run(f"async x{concurrency}", lambda: start_scraping_async(base_url, depth, concurrency=concurrency))
+
+    server.shutdown()
@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from synthetic_site import build_page
+from modules.data_processing import available_backends, parse_html
+
+
+def load_corpus(corpus_dir):
+    """
+    Read every *.html file of `corpus_dir`, or build synthetic pages when no directory is given.
+    """
+    if corpus_dir:
+        return [path.read_text(encoding="utf-8", errors="replace") for path in sorted(Path(corpus_dir).glob("**/*.html"))]
+    return [build_page(i, 10_000, 30).decode("utf-8") * 5 for i in range(300)]
+
+
+def run(backend, content_mode, pages):
+    start = time.time()
+    for html in pages:
+        parse_html("", html, content_mode, backend)
+    elapsed = time.time() - start
+    print(f"{backend:<12} {content_mode:<5} {len(pages)} pages in {elapsed:.2f}s ({len(pages) / elapsed:.1f} pages/s)")
+
+
+if __name__ == "__main__":
+    pages = load_corpus(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"\n=== PARSER BENCHMARK ({len(pages)} pages) ===")
+    for backend in available_backends():
+        for content_mode in ("full", "main"):
+            run(backend, content_mode, pages)
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from synthetic_site import start_server
+from modules.process_manager import iter_scraping_distributed
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'src', 'crawl_worker.py')
+
+
+def start_worker(db_path, lease_seconds):
+    return subprocess.Popen(
+        [sys.executable, WORKER_SCRIPT, db_path, "--batch-size", "5", "--lease-seconds", str(lease_seconds)],
+        stderr=subprocess.DEVNULL,
+    )
+
+
+if __name__ == "__main__":
+    pages, depth, workers = 300, 4, 4
+    server = start_server(pages=pages, fanout=5, min_latency=0.05, max_latency=0.2)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    db_path = os.path.join(tempfile.mkdtemp(), "frontier.db")
+
+    print("\n=== DISTRIBUTED CRAWL DEMO ===")
+    start = time.time()
+    records = iter_scraping_distributed(base_url, depth, db_path, poll_interval=0.2)
+    processes = [start_worker(db_path, lease_seconds=5) for _ in range(workers)]
+
+    urls = set()
+    killed = False
+    for record in records:
+        urls.add(record['url'])
+        # A crashed worker's leased URLs are picked up once its lease expires
+        if not killed and len(urls) >= 50:
+            processes[0].kill()
+            killed = True
+            print(f"killed worker {processes[0].pid} after {len(urls)} pages")
+    for process in processes:
+        process.wait()
+
+    elapsed = time.time() - start
+    print(f"{workers} workers: {len(urls)} unique pages in {elapsed:.2f}s ({len(urls) / elapsed:.2f} pages/s)")
+    server.shutdown()
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text, dimensions):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [digest[i % len(digest)] / 255 for i in range(dimensions)]
+
+
+def make_handler(dimensions, request_latency, per_text_latency):
+    class OllamaStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/api/embed":
+                texts = body.get("input", [])
+                texts = [texts] if isinstance(texts, str) else texts
+                time.sleep(request_latency + per_text_latency * len(texts))
+                payload = {"model": body.get("model"), "embeddings": [fake_embedding(t, dimensions) for t in texts]}
+            elif self.path == "/api/embeddings":
+                time.sleep(request_latency + per_text_latency)
+                payload = {"embedding": fake_embedding(body.get("prompt", ""), dimensions)}
+            else:
+                self.send_error(404)
+                return
+            content = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return OllamaStubHandler
+
+
+def start_stub(port=11435, dimensions=64, request_latency=0.02, per_text_latency=0.002):
+    """
+    Serve a fake Ollama embedding API on localhost in a background thread.
+
+    Every request costs `request_latency` plus `per_text_latency` per text,
+    which is roughly how a local model server behaves.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(dimensions, request_latency, per_text_latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    server = start_stub()
+    print(f"Serving Ollama stub on http://127.0.0.1:{server.server_port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
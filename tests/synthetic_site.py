@@ -0,0 +1,72 @@
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def build_page(page_id, pages, fanout):
+    children = [page_id * fanout + i for i in range(1, fanout + 1) if page_id * fanout + i < pages]
+    links = "".join(f'<li><a href="/page/{child}">Page {child}</a></li>' for child in children)
+    body = " ".join(f"Synthetic paragraph {page_id}-{i} with some filler text." for i in range(20))
+    return (
+        f"<html><head><title>Page {page_id}</title></head><body>"
+        f"<nav><a href=\"/page/0\">Home</a></nav><h1>Page {page_id}</h1><p>{body}</p><ul>{links}</ul>"
+        f"</body></html>"
+    ).encode("utf-8")
+
+
+def make_handler(pages, fanout, min_latency, max_latency):
+    class SyntheticSiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(random.uniform(min_latency, max_latency))
+            try:
+                page_id = int(self.path.rstrip("/").rsplit("/", 1)[-1] or 0)
+            except ValueError:
+                page_id = 0
+            if not 0 <= page_id < pages:
+                self.send_error(404)
+                return
+            content = build_page(page_id, pages, fanout)
+            etag = '"' + hashlib.md5(content).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SyntheticSiteHandler
+
+
+def start_server(port=8765, pages=500, fanout=5, min_latency=0.05, max_latency=0.5):
+    """
+    Serve a synthetic site of `pages` linked pages on localhost in a background thread.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(pages, fanout, min_latency, max_latency))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    server = start_server()
+    print(f"Serving synthetic site on http://127.0.0.1:{server.server_port}/page/0")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()